@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Profile, Transaction, Round, Ticket, BankWithdrawal
+from .models import Profile, Transaction, Round, Ticket, ArchivedTicket, BankWithdrawal, RoundExposure, LotterySettings
 
 
 
@@ -35,7 +35,26 @@ class BankWithdrawalAdmin(admin.ModelAdmin):
 
 
 
+@admin.register(RoundExposure)
+class RoundExposureAdmin(admin.ModelAdmin):
+    list_display = ("round", "combo", "stake", "tickets")
+    list_filter = ("size",)
+    ordering = ("-stake",)
+
+
+
+
+@admin.register(LotterySettings)
+class LotterySettingsAdmin(admin.ModelAdmin):
+    # Saving here invalidates every process's settings snapshot, see api/lottery_settings.py
+    list_display = ("key", "value")
+    list_editable = ("value",)
+
+
+
+
 admin.site.register(Transaction)
 admin.site.register(Round)
 admin.site.register(Ticket)
+admin.site.register(ArchivedTicket)
 
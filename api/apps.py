@@ -5,6 +5,10 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
 
+    def ready(self):
+        # Connects the cache invalidation receivers
+        from . import current_round, lottery_settings  # noqa: F401
+
     # def ready(self):
     #     # Start the APScheduler scheduler on Django startup
     #     from .scheduler import start_scheduler
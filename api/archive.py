@@ -0,0 +1,60 @@
+# api/archive.py
+
+"""
+Moves tickets of long-settled rounds from Ticket to ArchivedTicket.
+
+A finished round's tickets never change again, so they only need to stay
+in the hot table while players still look them up regularly. Each round is
+moved in chunks of consecutive ids, each chunk copied and deleted in its
+own transaction, so the job never holds a long lock. A run that dies
+half-way is finished by the next one: rows already copied are skipped.
+
+Ticket codes stay unique across both tables: when the allocator reserves a
+block it skips any code already held by a Ticket or ArchivedTicket, see
+api/ticket_codes.py. Lookups fall back to the archive in the read views.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ArchivedTicket, Round, Ticket
+
+ARCHIVE_CHUNK_SIZE = 2000
+ARCHIVED_FIELDS = (
+    "id", "ticket_code", "user_id", "round_id", "numbers", "amount",
+    "winning", "win_amount", "created_at", "round_seq",
+)
+
+
+def archivable_rounds(days, now=None):
+    """Ids of rounds settled (closed) more than `days` days ago that still have live tickets."""
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return list(
+        Round.objects.filter(
+            Exists(Ticket.objects.filter(round=OuterRef("pk"))),
+            is_finished=True,
+            accept_until__lt=cutoff,
+        )
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def archive_round(round_id, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Move all of a finished round's tickets to the archive. Returns how many were moved."""
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Ticket.objects.filter(round_id=round_id)
+                .order_by("id")
+                .values(*ARCHIVED_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                return moved
+            ArchivedTicket.objects.bulk_create([ArchivedTicket(**row) for row in rows], ignore_conflicts=True)
+            Ticket.objects.filter(round_id=round_id, id__gte=rows[0]["id"], id__lte=rows[-1]["id"]).delete()
+        moved += len(rows)
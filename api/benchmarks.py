@@ -0,0 +1,166 @@
+# api/benchmarks.py
+
+"""
+Helpers shared by the bench_* management commands.
+
+Benchmarks run against a throwaway, freshly migrated SQLite file so they
+never touch the real database.
+"""
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from .bitmask import numbers_to_mask
+from .models import Profile, Round, Ticket
+
+BULK_BATCH_SIZE = 5000
+
+
+@contextmanager
+def throwaway_database():
+    """Point the default connection at a temporary migrated DB for the block."""
+    tmpdir = tempfile.mkdtemp(prefix="bench-")
+    connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(tmpdir, "bench.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def create_players(count, balance=1_000_000):
+    """Create `count` users with funded profiles. Returns their ids."""
+    User.objects.bulk_create(
+        [User(username=f"bench{i}") for i in range(count)],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    user_ids = list(User.objects.filter(username__startswith="bench").values_list("id", flat=True))
+    Profile.objects.bulk_create(
+        [Profile(user_id=user_id, balance=balance) for user_id in user_ids],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    return user_ids
+
+
+def create_round_with_tickets(ticket_count, user_ids, seed=None):
+    """
+    Create an open round holding `ticket_count` random tickets spread over
+    the given users, with round_seq and coverage filled in as a real round would.
+
+    Rows go in through a raw executemany: the ORM's per-field preparation
+    would otherwise dominate the run time for large rounds. Columns not set
+    here take whatever a default Ticket() would store.
+    """
+    rng = random.Random(seed)
+    round_obj = Round.objects.create(accept_until=timezone.now() + timedelta(minutes=3))
+
+    template = Ticket(round=round_obj, user_id=user_ids[0], numbers=[], amount=0, created_at=timezone.now())
+    fields = [f for f in Ticket._meta.concrete_fields if not f.primary_key]
+    defaults = {f.column: f.get_db_prep_save(getattr(template, f.attname), connection) for f in fields}
+    varying = ["ticket_code", "round_seq", "user_id", "numbers", "amount", "numbers_mask_lo", "numbers_mask_hi"]
+    columns = varying + [column for column in defaults if column not in varying]
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        connection.ops.quote_name(Ticket._meta.db_table),
+        ", ".join(connection.ops.quote_name(c) for c in columns),
+        ", ".join(["%s"] * len(columns)),
+    )
+    fixed = [defaults[c] for c in columns[len(varying):]]
+
+    played = set()
+    total_stake = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, ticket_count, BULK_BATCH_SIZE):
+            rows = []
+            for seq in range(start + 1, min(start + BULK_BATCH_SIZE, ticket_count) + 1):
+                numbers = sorted(rng.sample(range(1, 91), 6))
+                played.update(numbers)
+                amount = rng.choice((100, 200, 500, 1000))
+                total_stake += amount
+                rows.append([
+                    f"{round_obj.id % 1000:03d}{seq:05X}",
+                    seq,
+                    rng.choice(user_ids),
+                    json.dumps(numbers),
+                    str(amount),
+                    *numbers_to_mask(numbers),
+                    *fixed,
+                ])
+            cursor.executemany(sql, rows)
+
+    round_obj.ticket_seq = round_obj.tickets_count = ticket_count
+    round_obj.total_stake = total_stake
+    round_obj.played_mask_lo, round_obj.played_mask_hi = numbers_to_mask(played)
+    round_obj.save(update_fields=["ticket_seq", "tickets_count", "total_stake", "played_mask_lo", "played_mask_hi"])
+    return round_obj
+
+
+def time_calls(func, repeat):
+    """Call func() `repeat` times and return the mean wall time in ms."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class StageRecorder:
+    """
+    Collects wall time, peak RSS, query count and rows written (SQLite's
+    total_changes) for named stages of a benchmark run:
+
+        recorder = StageRecorder()
+        with recorder.stage("settle"):
+            ...
+        recorder.stages  # list of dicts, ready for json.dump
+    """
+
+    def __init__(self):
+        self.stages = []
+        self._queries = 0
+
+    def _count(self, execute, sql, params, many, context):
+        self._queries += 1
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def _total_changes():
+        connection.ensure_connection()
+        return connection.connection.total_changes
+
+    @contextmanager
+    def stage(self, name, **extra):
+        self._queries = 0
+        changes = self._total_changes()
+        started = time.perf_counter()
+        with connection.execute_wrapper(self._count):
+            yield
+        self.stages.append({
+            "stage": name,
+            "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+            "peak_rss_mb": peak_rss_mb(),
+            "queries": self._queries,
+            "rows_written": self._total_changes() - changes,
+            **extra,
+        })
@@ -0,0 +1,37 @@
+# api/bitmask.py
+
+"""
+Compact bitmask form of a set of lottery numbers.
+
+Numbers 1–90 are split over two 45-bit halves so each half fits in a
+signed 64-bit DB integer (SQLite INTEGER, Postgres bigint):
+number n sets bit n-1 of ``lo`` for n <= 45, and bit n-46 of ``hi`` otherwise.
+"""
+
+MAX_NUMBER = 90
+HALF_BITS = 45
+
+
+def number_bit(n):
+    """Return (half, bit) for a number: half is 0 for ``lo`` and 1 for ``hi``."""
+    if not 1 <= n <= MAX_NUMBER:
+        raise ValueError(f"Number out of range: {n}")
+    if n <= HALF_BITS:
+        return 0, n - 1
+    return 1, n - 1 - HALF_BITS
+
+
+def numbers_to_mask(numbers):
+    """Return the (lo, hi) mask pair for an iterable of numbers in 1..90."""
+    halves = [0, 0]
+    for n in numbers:
+        half, bit = number_bit(n)
+        halves[half] |= 1 << bit
+    return halves[0], halves[1]
+
+
+def mask_to_numbers(lo, hi):
+    """Return the sorted list of numbers set in a (lo, hi) mask pair."""
+    numbers = [n + 1 for n in range(HALF_BITS) if lo >> n & 1]
+    numbers += [n + 1 + HALF_BITS for n in range(HALF_BITS) if hi >> n & 1]
+    return numbers
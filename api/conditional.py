@@ -0,0 +1,59 @@
+# api/conditional.py
+
+"""
+Conditional GET for DRF views whose response is determined by a few
+version fields (a round's id and state, a ticket's settlement), so a
+strong ETag can be computed before the body is built.
+
+A view calls `self.not_modified(request, version, fresh_for)` once it
+knows the version. That returns a 304 Response if the client already
+holds that version, and otherwise lets the view build its body as usual.
+Either way finalize_response stamps ETag, Cache-Control and Expires, so
+browsers and CDNs reuse the response for `fresh_for` seconds and
+revalidate it cheaply after that.
+"""
+
+import hashlib
+import time
+
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+# How long a response that can no longer change (finished round, settled ticket) may be reused
+FINAL_MAX_AGE = 24 * 60 * 60
+
+
+def make_etag(*version):
+    digest = hashlib.blake2b(repr(version).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+class ConditionalGetMixin:
+    etag = None
+
+    def not_modified(self, request, version, fresh_for, private=False):
+        """
+        Declare this response's version and for how many seconds it stays
+        valid. Returns a 304 Response if If-None-Match already names it, else None.
+        """
+        return self.not_modified_etag(request, make_etag(type(self).__name__, *version), fresh_for, private)
+
+    def not_modified_etag(self, request, etag, fresh_for, private=False):
+        """not_modified for an ETag computed ahead of the request (see api/round_status.py)."""
+        self.etag = etag
+        self.fresh_for = max(int(fresh_for), 0)
+        self.private = private
+        if self.etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response["ETag"] = self.etag
+            scope = {"private": True} if self.private else {"public": True}
+            patch_cache_control(response, max_age=self.fresh_for, **scope)
+            response["Expires"] = http_date(time.time() + self.fresh_for)
+        return response
@@ -0,0 +1,89 @@
+# api/current_round.py
+
+"""
+Cached answer to "which round is accepting plays right now?".
+
+The play and status endpoints share one descriptor in the Django cache:
+the open round's id and accept_until, or when the next scheduled round
+opens. It stays valid until that deadline, and the scheduler deletes it
+whenever it opens or closes a round; saving a Round through the ORM
+(admin edits included) does the same. With a shared cache (Redis) every
+worker sees the deletion at once; with LocMem each worker still drops its
+copy at the deadline.
+"""
+
+import math
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Round
+
+CACHE_KEY = "rounds:current"
+STATUS_SNAPSHOT_KEY = "rounds:current:status"  # rendered status body, see api/round_status.py
+IDLE_RECHECK_SECONDS = 5  # how long "no round, none scheduled" is trusted
+
+
+def current_round_state(now=None):
+    """
+    {"round_id", "accept_until", "next_opens_at", "valid_until"} for the
+    open round (round_id is None between rounds), from the cache when possible.
+    """
+    now = now or timezone.now()
+    state = cache.get(CACHE_KEY)
+    if state is None or state["valid_until"] <= now:
+        state = load_state(now)
+        timeout = max(math.ceil((state["valid_until"] - now).total_seconds()), 1)
+        cache.set(CACHE_KEY, state, timeout)
+    return state
+
+
+def load_state(now):
+    current = Round.objects.filter(
+        is_accepting=True,
+        is_finished=False,
+        accept_until__gt=now
+    ).order_by("-id").values("id", "accept_until").first()
+
+    if current:
+        return {
+            "round_id": current["id"],
+            "accept_until": current["accept_until"],
+            "next_opens_at": None,
+            "valid_until": current["accept_until"],
+        }
+
+    upcoming = Round.objects.next_scheduled(now)
+    next_opens_at = upcoming.opens_at if upcoming else None
+    if next_opens_at and next_opens_at > now:
+        valid_until = next_opens_at
+    else:
+        # Nothing scheduled, or the scheduler is about to open it
+        valid_until = now + timedelta(seconds=1 if next_opens_at else IDLE_RECHECK_SECONDS)
+    return {
+        "round_id": None,
+        "accept_until": None,
+        "next_opens_at": next_opens_at,
+        "valid_until": valid_until,
+    }
+
+
+def get_current_round(now=None):
+    """The open Round as a lightweight instance (id and accept_until only), or None."""
+    state = current_round_state(now)
+    if state["round_id"] is None:
+        return None
+    return Round(id=state["round_id"], accept_until=state["accept_until"], is_accepting=True, is_finished=False)
+
+
+def invalidate_current_round():
+    cache.delete_many([CACHE_KEY, STATUS_SNAPSHOT_KEY])
+
+
+@receiver(post_save, sender=Round)
+@receiver(post_delete, sender=Round)
+def round_changed(sender, **kwargs):
+    invalidate_current_round()
@@ -0,0 +1,168 @@
+# api/draw_optimizer.py
+
+"""
+Exposure-aware draw selection.
+
+A ticket matching m numbers of the draw pays stake * f(m), f being
+WIN_MULTIPLIER_MAP. Any such f can be rewritten as f(m) = sum_k a_k * C(m, k),
+so the payout of a draw D is
+
+    sum_k a_k * sum over k-subsets S of D of (total stake of tickets containing S)
+
+The inner totals only depend on the tickets, so they are built once per
+round as NumPy arrays indexed by subset rank. Scoring a candidate is then a
+few dozen array lookups however many tickets the round has, and the result
+is the exact payout (in cents), not an estimate.
+"""
+
+import time
+from collections import namedtuple
+from decimal import Decimal
+from itertools import combinations
+from math import comb
+
+import numpy as np
+from django.conf import settings
+
+from .bitmask import numbers_to_mask
+
+DRAW_POOL = range(1, 41)   # draws come from 1..40, i.e. only the `lo` mask half
+DRAW_SIZE = 6
+TICKET_BATCH = 100_000     # tickets expanded into subsets per NumPy step
+
+DrawChoice = namedtuple("DrawChoice", "draw payout candidates_scored elapsed_ms")
+
+# BINOM[n, r] == C(n, r), used to rank k-subsets of the pool
+BINOM = np.array([[comb(n, r) for r in range(DRAW_SIZE + 1)] for n in range(len(DRAW_POOL) + 1)], dtype=np.int64)
+
+
+def subset_coefficients(multiplier_map):
+    """{k: a_k} such that multiplier(m) == sum_k a_k * C(m, k) for m in 0..DRAW_SIZE."""
+    f = [multiplier_map.get(m, 0) for m in range(DRAW_SIZE + 1)]
+    coefficients = {}
+    for k in range(1, DRAW_SIZE + 1):
+        a = sum((-1) ** (k - j) * comb(k, j) * f[j] for j in range(k + 1))
+        if a:
+            coefficients[k] = a
+    return coefficients
+
+
+def subset_ranks(positions, k):
+    """
+    Rank every k-subset of each row of `positions` (sorted 0-based pool
+    positions, shape (n, p)). Returns an (n, C(p, k)) array of ranks in [0, C(40, k)).
+    """
+    picks = np.array(list(combinations(range(positions.shape[1]), k)), dtype=np.intp)
+    subsets = positions[:, picks]  # (n, C(p, k), k)
+    return sum(BINOM[subsets[..., i], i + 1] for i in range(k))
+
+
+def load_ticket_matrix(tickets):
+    """
+    Return (masks, stakes) for a ticket queryset: the `lo` mask restricted to
+    DRAW_POOL, and the summed stake in cents of all tickets sharing that mask.
+    """
+    rows = list(tickets.values_list("numbers_mask_lo", "amount"))
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    pool_lo, _ = numbers_to_mask(DRAW_POOL)
+    masks = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)) & pool_lo
+    stakes = np.fromiter((int(r[1] * 100) for r in rows), dtype=np.int64, count=len(rows))
+
+    masks, inverse = np.unique(masks, return_inverse=True)
+    return masks, np.bincount(inverse, weights=stakes).astype(np.int64)
+
+
+def build_exposure_tables(masks, stakes, coefficients):
+    """{k: array of total stake per k-subset of the pool} for every k in coefficients."""
+    tables = {k: np.zeros(comb(len(DRAW_POOL), k), dtype=np.int64) for k in coefficients}
+    bits = np.arange(len(DRAW_POOL), dtype=np.int64)
+
+    for start in range(0, len(masks), TICKET_BATCH):
+        batch_masks = masks[start:start + TICKET_BATCH]
+        batch_stakes = stakes[start:start + TICKET_BATCH]
+        present = (batch_masks[:, None] >> bits) & 1
+        sizes = present.sum(axis=1)
+
+        for p in range(1, DRAW_SIZE + 1):
+            rows = np.flatnonzero(sizes == p)
+            if not len(rows):
+                continue
+            # np.nonzero walks row by row, so each row's positions come out sorted
+            positions = np.nonzero(present[rows])[1].reshape(len(rows), p)
+            for k, table in tables.items():
+                if k > p:
+                    continue
+                ranks = subset_ranks(positions, k)
+                weights = np.repeat(batch_stakes[rows], ranks.shape[1])
+                table += np.bincount(ranks.ravel(), weights=weights, minlength=len(table)).astype(np.int64)
+
+    return tables
+
+
+def score_draws(tables, coefficients, draws):
+    """Exact payout in cents of each candidate draw (shape (K, DRAW_SIZE), numbers from DRAW_POOL)."""
+    positions = np.sort(np.asarray(draws, dtype=np.int64), axis=1) - DRAW_POOL[0]
+    payouts = np.zeros(len(positions), dtype=np.int64)
+    for k, a in coefficients.items():
+        payouts += a * tables[k][subset_ranks(positions, k)].sum(axis=1)
+    return payouts
+
+
+def random_candidates(count, rng):
+    """(count, DRAW_SIZE) array of random draws from DRAW_POOL."""
+    pool = np.array(DRAW_POOL, dtype=np.int64)
+    picks = np.argpartition(rng.random((count, len(pool))), DRAW_SIZE, axis=1)[:, :DRAW_SIZE]
+    return np.sort(pool[picks], axis=1)
+
+
+def choose_draw_by_exposure(tickets, multiplier_map, rng=None):
+    """
+    Pick a draw for a losing round according to settings.DRAW_OPTIMIZER_POLICY:
+
+    - "min_payout": the cheapest candidate found (stops early at zero).
+    - "random_below_cap": a random candidate paying at most
+      DRAW_OPTIMIZER_MAX_PAYOUT_RATIO of the round's total stake,
+      falling back to the cheapest one.
+
+    Returns a DrawChoice with the payout in currency units.
+    """
+    rng = rng or np.random.default_rng()
+    started = time.perf_counter()
+    budget = settings.DRAW_OPTIMIZER_TIME_BUDGET_MS / 1000
+    policy = settings.DRAW_OPTIMIZER_POLICY
+    batch_size = settings.DRAW_OPTIMIZER_BATCH
+
+    coefficients = subset_coefficients(multiplier_map)
+    masks, stakes = load_ticket_matrix(tickets)
+    tables = build_exposure_tables(masks, stakes, coefficients)
+    cap = int(stakes.sum() * settings.DRAW_OPTIMIZER_MAX_PAYOUT_RATIO)
+
+    best_draw, best_payout, scored = None, None, 0
+    under_cap = []
+    while scored < settings.DRAW_OPTIMIZER_CANDIDATES:
+        draws = random_candidates(batch_size, rng)
+        payouts = score_draws(tables, coefficients, draws)
+        scored += len(draws)
+
+        i = int(payouts.argmin())
+        if best_payout is None or payouts[i] < best_payout:
+            best_draw, best_payout = draws[i], int(payouts[i])
+        if policy == "random_below_cap":
+            under_cap.extend((draws[j], int(payouts[j])) for j in np.flatnonzero(payouts <= cap))
+
+        if policy == "min_payout" and best_payout == 0:
+            break
+        if time.perf_counter() - started >= budget:
+            break
+
+    if under_cap:
+        best_draw, best_payout = under_cap[rng.integers(len(under_cap))]
+
+    return DrawChoice(
+        draw=[int(n) for n in best_draw],
+        payout=Decimal(best_payout) / 100,
+        candidates_scored=scored,
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
@@ -0,0 +1,115 @@
+# api/lottery_settings.py
+
+"""
+Typed, in-process view of the LotterySettings table.
+
+All rows are loaded in one query into a frozen LotteryConfig snapshot that
+is reused until it is invalidated. Saving or deleting a LotterySettings row
+(admin included) bumps a version number in the Django cache, and every
+process reloads its snapshot when it sees a new version. With a per-process
+cache (LocMem) other processes only notice after LOTTERY_SETTINGS_TTL
+seconds, so that TTL bounds how stale a snapshot can get.
+
+The cycle counter changes after every round and the scheduler must never
+act on an old value, so it is not part of the snapshot: get_cycle_counter
+reads it from the DB each time.
+"""
+
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import LotterySettings
+
+CYCLE_KEY = "cycle_counter"                # rounds_played of the lose/win cycle
+CYCLE_DEFAULT = 1
+MULTIPLIER_KEY = "win_multiplier_{}"       # payout multiplier for N matching numbers
+VERSION_CACHE_KEY = "lottery_settings:version"
+
+DEFAULT_WIN_MULTIPLIERS = {
+    3: 5,   # 3 numbers match → ×5
+    4: 7,   # 4 numbers match → ×7
+    5: 15,  # 5 numbers match → ×15
+    6: 50   # 6 numbers match → ×50
+}
+
+
+@dataclass(frozen=True)
+class LotteryConfig:
+    win_multipliers: dict = field(default_factory=lambda: dict(DEFAULT_WIN_MULTIPLIERS))
+    total_lose_rounds: int = 5
+    round_duration_minutes: int = 3
+    break_duration_seconds: int = 30
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a snapshot from {key: value}, falling back to the defaults for missing keys."""
+        multipliers = {
+            matches: rows.get(MULTIPLIER_KEY.format(matches), default)
+            for matches, default in DEFAULT_WIN_MULTIPLIERS.items()
+        }
+        defaults = cls()
+        return cls(
+            win_multipliers=multipliers,
+            total_lose_rounds=rows.get("total_lose_rounds", defaults.total_lose_rounds),
+            round_duration_minutes=rows.get("round_duration_minutes", defaults.round_duration_minutes),
+            break_duration_seconds=rows.get("break_duration_seconds", defaults.break_duration_seconds),
+        )
+
+
+DEFAULTS = LotteryConfig()
+
+# (snapshot, cache version it was loaded under, monotonic load time)
+_state = (None, None, 0.0)
+
+
+def get_lottery_settings():
+    """Current LotteryConfig, from memory unless it was invalidated or has expired."""
+    global _state
+    snapshot, version, loaded_at = _state
+    current_version = cache.get(VERSION_CACHE_KEY)
+
+    if (
+        snapshot is None
+        or version != current_version
+        or time.monotonic() - loaded_at >= settings.LOTTERY_SETTINGS_TTL
+    ):
+        rows = LotterySettings.objects.exclude(key=CYCLE_KEY).values_list("key", "value")
+        snapshot = LotteryConfig.from_rows(dict(rows))
+        _state = (snapshot, current_version, time.monotonic())
+    return snapshot
+
+
+def get_cycle_counter():
+    """The lose/win cycle position, read from the DB (never cached)."""
+    value = LotterySettings.objects.filter(key=CYCLE_KEY).values_list("value", flat=True).first()
+    return CYCLE_DEFAULT if value is None else value
+
+
+def invalidate():
+    """Drop this process's snapshot now, and every other process's once the change is committed."""
+    global _state
+    _state = (None, None, 0.0)
+    transaction.on_commit(lambda: cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None))
+
+
+def set_value(key, value):
+    """Write one setting with a single UPDATE (INSERT the first time) and invalidate."""
+    if not LotterySettings.objects.filter(key=key).update(value=value):
+        LotterySettings.objects.create(key=key, value=value)
+    elif key != CYCLE_KEY:
+        invalidate()
+
+
+@receiver(post_save, sender=LotterySettings)
+@receiver(post_delete, sender=LotterySettings)
+def lottery_settings_changed(sender, instance, **kwargs):
+    # The snapshot does not hold the cycle counter, see get_cycle_counter
+    if instance.key != CYCLE_KEY:
+        invalidate()
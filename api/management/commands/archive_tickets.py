@@ -0,0 +1,27 @@
+# api/management/commands/archive_tickets.py
+
+from django.core.management.base import BaseCommand
+
+from api.archive import ARCHIVE_CHUNK_SIZE, archivable_rounds, archive_round
+
+
+class Command(BaseCommand):
+    help = "Move tickets of rounds settled more than --days days ago into the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--chunk-size", type=int, default=ARCHIVE_CHUNK_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Only list the rounds that would be archived")
+
+    def handle(self, *args, **options):
+        round_ids = archivable_rounds(options["days"])
+        if options["dry_run"]:
+            self.stdout.write(f"{len(round_ids)} rounds to archive: {round_ids}")
+            return
+
+        total = 0
+        for round_id in round_ids:
+            moved = archive_round(round_id, options["chunk_size"])
+            total += moved
+            self.stdout.write(f"Archived {moved} tickets of round #{round_id}")
+        self.stdout.write(f"Archived {total} tickets from {len(round_ids)} rounds")
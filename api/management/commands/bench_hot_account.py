@@ -0,0 +1,101 @@
+# api/management/commands/bench_hot_account.py
+
+import random
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.benchmarks import throwaway_database, create_players
+from api.models import Profile, Round, Ticket
+from api.ticket_staging import flush_staged_tickets, staging_enabled
+
+
+class Command(BaseCommand):
+    help = "Stress concurrent plays against a single account in a throwaway SQLite DB"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--amount", type=int, default=10)
+        parser.add_argument(
+            "--balance", type=int, default=1_000_000,
+            help="Starting balance; make it small to also exercise overdraft rejections",
+        )
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            user_id = create_players(1, balance=options["balance"])[0]
+            for threads in options["threads"]:
+                Profile.objects.filter(user_id=user_id).update(balance=options["balance"])
+                round_obj = Round.objects.create(
+                    accept_until=timezone.now() + timedelta(seconds=options["seconds"] + 60),
+                )
+                self.run_threads(threads, user_id, round_obj, options)
+                Round.objects.filter(pk=round_obj.pk).update(is_accepting=False)
+
+    def run_threads(self, threads, user_id, round_obj, options):
+        amount = options["amount"]
+        deadline = time.perf_counter() + options["seconds"]
+        results = {"accepted": 0, "rejected": 0, "errors": 0, "latencies": []}
+        lock = threading.Lock()
+
+        def worker():
+            # Errors come back as 500s: raised exceptions would be routed
+            # to whichever thread's client is listening at the time
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(User.objects.get(pk=user_id))
+            rng = random.Random()
+            local = {"accepted": 0, "rejected": 0, "errors": 0, "latencies": []}
+            try:
+                while time.perf_counter() < deadline:
+                    numbers = rng.sample(range(1, 91), 6)
+                    t0 = time.perf_counter()
+                    response = client.post("/play/", {"numbers": numbers, "amount": amount}, format="json")
+                    local["latencies"].append((time.perf_counter() - t0) * 1000)
+                    if response.status_code == 201:
+                        local["accepted"] += 1
+                    elif response.status_code == 400:
+                        local["rejected"] += 1
+                    else:
+                        # e.g. "database is locked" once SQLite's busy timeout runs out
+                        local["errors"] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in local.items():
+                        results[key] += value
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        if staging_enabled():
+            flush_staged_tickets(round_obj.id)
+
+        balance = Profile.objects.get(user_id=user_id).balance
+        tickets = Ticket.objects.filter(round=round_obj).count()
+        consistent = (
+            tickets == results["accepted"]
+            and balance == options["balance"] - results["accepted"] * amount
+            and balance >= 0
+        )
+        latencies = sorted(results["latencies"]) or [0]
+
+        self.stdout.write(
+            f"{threads:>3} threads: {results['accepted'] / elapsed:8.1f} plays/s, "
+            f"accepted {results['accepted']}, rejected {results['rejected']}, errors {results['errors']}, "
+            f"p50 {statistics.median(latencies):.1f} ms, p99 {latencies[int((len(latencies) - 1) * 0.99)]:.1f} ms, "
+            f"balance {'consistent' if consistent else 'INCONSISTENT'} ({balance})"
+        )
+
@@ -0,0 +1,89 @@
+# api/management/commands/bench_settlement.py
+
+import io
+import json
+import platform
+import subprocess
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.benchmarks import throwaway_database, create_players, create_round_with_tickets, StageRecorder
+from api.management.commands.manage_rounds import Command as ManageRoundsCommand
+from api.lottery_settings import CYCLE_KEY, get_lottery_settings, set_value
+from api.models import Ticket
+from api.settlement import settle_tickets, credit_winners
+from api.utils import TOTAL_LOSE_ROUNDS, choose_draw
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark round settlement on synthetic rounds in a throwaway SQLite DB"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickets", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument(
+            "--cycle", type=int, default=TOTAL_LOSE_ROUNDS,
+            help="rounds_played value to settle with (default: a winning round)",
+        )
+        parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+
+    def handle(self, *args, **options):
+        cycle = options["cycle"]
+        results = {
+            "revision": git_revision(),
+            "started_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "cycle": cycle,
+            "runs": [],
+        }
+
+        with throwaway_database():
+            recorder = StageRecorder()
+            with recorder.stage("create_players", users=options["users"]):
+                user_ids = create_players(options["users"])
+            results["setup"] = recorder.stages
+
+            for ticket_count in options["tickets"]:
+                self.stderr.write(f"Settling {ticket_count} tickets...")
+                results["runs"].append(self.run_size(ticket_count, user_ids, cycle))
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def run_size(self, ticket_count, user_ids, cycle):
+        recorder = StageRecorder()
+
+        # Stage by stage, as finalize_round runs them
+        with recorder.stage("create_tickets"):
+            round_obj = create_round_with_tickets(ticket_count, user_ids, seed=ticket_count)
+        tickets = Ticket.objects.filter(round=round_obj)
+
+        with recorder.stage("choose_draw"):
+            draw = choose_draw(round_obj, cycle)
+        with recorder.stage("settle_tickets"):
+            winners = settle_tickets(tickets, draw, get_lottery_settings().win_multipliers)
+        with recorder.stage("credit_winners", winners=len(winners)):
+            credit_winners(round_obj, winners)
+
+        # End to end, through the same path the scheduler uses
+        round_obj = create_round_with_tickets(ticket_count, user_ids, seed=ticket_count + 1)
+        set_value(CYCLE_KEY, cycle)
+        with recorder.stage("end_round"):
+            ManageRoundsCommand(stdout=io.StringIO()).end_round(round_obj)
+
+        return {"tickets": ticket_count, "stages": recorder.stages}
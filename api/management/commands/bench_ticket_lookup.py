@@ -0,0 +1,84 @@
+# api/management/commands/bench_ticket_lookup.py
+
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from api.benchmarks import throwaway_database, create_players, create_round_with_tickets
+from api.models import Ticket
+from api.serializers import TicketSerializer
+from api.views import PlayTicketView, TicketDetailView
+
+
+class ModelTicketDetailView(APIView):
+    """TicketDetailView as it was before the values() read path."""
+
+    def get(self, request, ticket_code):
+        try:
+            ticket = Ticket.objects.get(ticket_code=ticket_code)
+        except Ticket.DoesNotExist:
+            return Response({"detail": "Ticket not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(TicketSerializer(ticket).data)
+
+
+class ModelPlayTicketView(APIView):
+    """PlayTicketView.get as it was before the values() read path."""
+
+    def get(self, request, ticket_code):
+        try:
+            ticket = Ticket.objects.get(ticket_code=ticket_code, user=request.user)
+        except Ticket.DoesNotExist:
+            return Response({"detail": "Ticket not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {
+                "ticket_code": ticket.ticket_code,
+                "round_id": ticket.round.id,
+                "numbers": ticket.numbers,
+                "amount": ticket.amount,
+                "created_at": ticket.created_at
+            },
+            status=200
+        )
+
+
+class Command(BaseCommand):
+    help = "Compare ticket lookup throughput of the model-based and values() read paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickets", type=int, default=100_000)
+        parser.add_argument("--requests", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            user_id = create_players(1)[0]
+            round_obj = create_round_with_tickets(options["tickets"], [user_id], seed=1)
+            user = User.objects.get(pk=user_id)
+            codes = list(Ticket.objects.filter(round=round_obj).values_list("ticket_code", flat=True))
+            codes = random.Random(1).choices(codes, k=options["requests"])
+
+            for name, before, after in [
+                ("tickets/<code>/", ModelTicketDetailView, TicketDetailView),
+                ("play/<code>/", ModelPlayTicketView, PlayTicketView),
+            ]:
+                old = self.requests_per_second(before.as_view(), user, codes)
+                new = self.requests_per_second(after.as_view(), user, codes)
+                self.stdout.write(
+                    f"{name:<16} model: {old:8.0f} req/s   values(): {new:8.0f} req/s   ({new / old:.2f}x)"
+                )
+
+    def requests_per_second(self, view, user, codes):
+        factory = APIRequestFactory()
+        started = time.perf_counter()
+        for code in codes:
+            request = factory.get(f"/x/{code}/")
+            force_authenticate(request, user=user)
+            response = view(request, ticket_code=code)
+            response.render()
+            assert response.status_code == 200, response.data
+        return len(codes) / (time.perf_counter() - started)
@@ -0,0 +1,38 @@
+# api/management/commands/bench_winner_pick.py
+
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import throwaway_database, create_players, create_round_with_tickets, time_calls
+
+
+class Command(BaseCommand):
+    help = "Compare ORDER BY RANDOM() winner selection with Round.random_ticket()"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickets", type=int, nargs="+", default=[10_000, 100_000])
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+
+        with throwaway_database():
+            user_ids = create_players(options["users"])
+
+            for ticket_count in options["tickets"]:
+                round_obj = create_round_with_tickets(ticket_count, user_ids, seed=ticket_count)
+
+                order_by_ms = time_calls(lambda: round_obj.tickets.order_by("?").first(), repeat)
+                seq_ms = time_calls(round_obj.random_ticket, repeat)
+
+                self.stdout.write(
+                    f"{ticket_count} tickets: order_by('?') {order_by_ms:.2f} ms, "
+                    f"random_ticket {seq_ms:.2f} ms ({order_by_ms / seq_ms:.0f}x)"
+                )
+
+            # Fairness: every ticket of a small round should come up about equally often
+            small = create_round_with_tickets(10, user_ids, seed=0)
+            picks = Counter(small.random_ticket().round_seq for _ in range(10_000))
+            self.stdout.write(f"Pick counts over 10 tickets x 10000 draws: {sorted(picks.values())}")
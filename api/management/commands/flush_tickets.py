@@ -0,0 +1,30 @@
+# api/management/commands/flush_tickets.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.ticket_staging import flush_staged_tickets
+
+
+class Command(BaseCommand):
+    help = "Move staged tickets from the write-behind buffer into the Ticket table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--round", type=int, help="Only flush this round")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running, flushing every INTERVAL seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            created, refunded = flush_staged_tickets(options["round"])
+            if created or refunded:
+                self.stdout.write(f"Flushed {created} staged tickets, refunded {refunded} late ones")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -1,15 +1,21 @@
 # api/management/commands/manage_rounds.py
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db.models import Max
 from django.utils import timezone
 from datetime import timedelta
 
-from api.models import Round, LotterySettings
+from api.current_round import invalidate_current_round
+from api.round_status import publish_status_snapshot
+from api.lottery_settings import CYCLE_KEY, get_cycle_counter, get_lottery_settings, set_value
+from api.models import Round
+from api.tasks import dispatch_settlement, resume_stalled_settlements
+from api.ticket_staging import flush_staged_tickets, staging_enabled
 from api.utils import finalize_round
 
-ROUND_DURATION_MINUTES = 3
-BREAK_DURATION_SECONDS = 30
-CYCLE_KEY = "cycle_counter"
+# Round length and break come from get_lottery_settings()
+UPCOMING_ROUNDS = 3  # rounds kept pre-allocated ahead of the current one
 
 
 class Command(BaseCommand):
@@ -19,53 +25,98 @@ class Command(BaseCommand):
         now = timezone.now()
         active_round = Round.objects.filter(is_accepting=True, is_finished=False).first()
 
+        if active_round and now >= active_round.accept_until:
+            self.end_round(active_round)
+            active_round = None
+
+        if settings.SETTLEMENT_FANOUT:
+            for round_id in resume_stalled_settlements(now):
+                self.stdout.write(f"Settlement of round #{round_id} stalled, dispatched it again")
+
+        # Keep the calendar topped up so the next round already exists when it is due
+        self.schedule_rounds(now)
+
         if active_round:
-            # Round exists: check if expired
-            if now >= active_round.accept_until:
-                self.end_round(active_round)
-            else:
-                self.stdout.write(
-                    f"Round #{active_round.id} still active. "
-                    f"Time left: {active_round.accept_until - now}"
-                )
+            self.stdout.write(
+                f"Round #{active_round.id} still active. "
+                f"Time left: {active_round.accept_until - now}"
+            )
+        elif self.open_due_round(now):
+            # Replace the round that just left the calendar
+            self.schedule_rounds(now)
         else:
-            # No active round → check break period
-            last_round = Round.objects.filter(is_finished=True).order_by("-id").first()
-            if last_round:
-                elapsed = (now - last_round.accept_until).total_seconds()
-                if elapsed >= BREAK_DURATION_SECONDS:
-                    self.start_new_round()
-                else:
-                    self.stdout.write(
-                        f"Waiting for break to finish. {BREAK_DURATION_SECONDS - int(elapsed)} seconds left"
-                    )
-            else:
-                # First ever round
-                self.start_new_round()
-
-    def start_new_round(self):
-        now = timezone.now()
-        r = Round.objects.create(
-            is_accepting=True,
-            is_finished=False,
-            accept_until=now + timedelta(minutes=ROUND_DURATION_MINUTES),
-            no_match_draws=0,
-        )
-        self.stdout.write(f"Started round #{r.id}, ends at {r.accept_until}")
+            upcoming = Round.objects.next_scheduled(now)
+            self.stdout.write(
+                f"Waiting for break to finish. Round #{upcoming.id} opens at {upcoming.opens_at}"
+            )
+
+    def schedule_rounds(self, now):
+        """
+        Pre-create rounds until UPCOMING_ROUNDS are waiting to open, each one
+        starting break_duration_seconds after the previous one closes.
+        Rounds already on the calendar keep the timings they were created with.
+        """
+        # Windows missed while the scheduler was down never took a ticket
+        Round.objects.scheduled().filter(accept_until__lte=now).delete()
+
+        missing = UPCOMING_ROUNDS - Round.objects.scheduled().count()
+        if missing <= 0:
+            return
+
+        config = get_lottery_settings()
+        round_length = timedelta(minutes=config.round_duration_minutes)
+        break_length = timedelta(seconds=config.break_duration_seconds)
+
+        last_close = Round.objects.aggregate(last=Max("accept_until"))["last"]
+        opens_at = max(last_close + break_length, now) if last_close else now
+
+        rounds = []
+        for _ in range(missing):
+            accept_until = opens_at + round_length
+            rounds.append(Round(
+                is_accepting=False,
+                is_finished=False,
+                opens_at=opens_at,
+                accept_until=accept_until,
+                no_match_draws=0,
+            ))
+            opens_at = accept_until + break_length
+        Round.objects.bulk_create(rounds)
+
+    def open_due_round(self, now):
+        """Start accepting plays on the scheduled round whose window has begun."""
+        due = Round.objects.scheduled().filter(opens_at__lte=now, accept_until__gt=now).order_by("opens_at").first()
+        if not due:
+            return None
+        Round.objects.filter(pk=due.pk, is_accepting=False, is_finished=False).update(is_accepting=True)
+        invalidate_current_round()
+        publish_status_snapshot()
+        self.stdout.write(f"Started round #{due.id}, ends at {due.accept_until}")
+        return due
 
     def end_round(self, round_obj):
-        # Get current cycle counter from DB, create if missing
-        setting, created = LotterySettings.objects.get_or_create(
-            key=CYCLE_KEY,
-            defaults={"value": 1}
-        )
-        cycle_counter = setting.value
+        cycle_counter = get_cycle_counter()
+
+        if staging_enabled():
+            # Settlement must see every ticket staged before accept_until
+            created, refunded = flush_staged_tickets()
+            if created or refunded:
+                self.stdout.write(f"Flushed {created} staged tickets, refunded {refunded} late ones")
+
+        if settings.SETTLEMENT_FANOUT and round_obj.ticket_seq >= settings.SETTLEMENT_FANOUT_MIN_TICKETS:
+            # Workers settle the tickets; the next cycle is saved with the draw
+            dispatch_settlement(round_obj, cycle_counter, settings.SETTLEMENT_CHUNK_TICKETS)
+            invalidate_current_round()
+            publish_status_snapshot()
+            self.stdout.write(f"Closed round #{round_obj.id}, settling {round_obj.ticket_seq} tickets on workers")
+            return
 
         # Finalize the round using utils.py
         next_cycle = finalize_round(round_obj, cycle_counter)
+        invalidate_current_round()
+        publish_status_snapshot()
 
         # Save updated counter back to DB
-        setting.value = next_cycle
-        setting.save()
+        set_value(CYCLE_KEY, next_cycle)
 
         self.stdout.write(f"Ended round #{round_obj.id}, next cycle #{next_cycle}")
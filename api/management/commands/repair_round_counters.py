@@ -0,0 +1,19 @@
+# api/management/commands/repair_round_counters.py
+
+from django.core.management.base import BaseCommand
+
+from api.models import Round
+
+
+class Command(BaseCommand):
+    help = "Recompute Round.tickets_count and total_stake from the rounds' tickets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--round", type=int, help="Only repair this round")
+
+    def handle(self, *args, **options):
+        rounds = Round.objects.all()
+        if options["round"] is not None:
+            rounds = rounds.filter(pk=options["round"])
+        fixed = rounds.repair_ticket_counters()
+        self.stdout.write(f"Repaired ticket counters of {fixed} rounds")
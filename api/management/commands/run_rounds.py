@@ -0,0 +1,74 @@
+# api/management/commands/run_rounds.py
+
+import time
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api.models import Round
+from .manage_rounds import Command as ManageRoundsCommand
+
+MAX_SLEEP_SECONDS = 60   # re-check the DB at least this often
+ERROR_BACKOFF_SECONDS = 1
+
+
+class Command(ManageRoundsCommand):
+    help = "Run the lottery round scheduler as a long-lived process"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-sleep",
+            type=float,
+            default=MAX_SLEEP_SECONDS,
+            help="Longest time to sleep before re-reading round state from the DB",
+        )
+
+    def handle(self, *args, **options):
+        max_sleep = options["max_sleep"]
+        self.stdout.write("Round scheduler started")
+
+        try:
+            while True:
+                close_old_connections()
+                deadline = self.next_deadline()
+                wait = (deadline - timezone.now()).total_seconds()
+
+                if wait > max_sleep:
+                    # Nothing due yet: sleep, then re-read in case an admin changed something
+                    time.sleep(max_sleep)
+                    continue
+                if wait > 0:
+                    time.sleep(wait)
+
+                self.tick(deadline)
+        except KeyboardInterrupt:
+            self.stdout.write("Round scheduler stopped")
+
+    def next_deadline(self):
+        """
+        When the next state change is due: the active round's accept_until,
+        or the opening of the next pre-allocated round.
+        """
+        active_round = Round.objects.filter(is_accepting=True, is_finished=False).first()
+        if active_round:
+            return active_round.accept_until
+
+        upcoming = Round.objects.next_scheduled()
+        if upcoming:
+            return upcoming.opens_at
+
+        # Empty calendar: the next tick schedules and opens a round
+        return timezone.now()
+
+    def tick(self, deadline):
+        started = timezone.now()
+        t0 = time.perf_counter()
+        try:
+            super().handle()
+        except Exception as e:
+            self.stderr.write(f"Scheduler tick failed: {e}")
+            time.sleep(ERROR_BACKOFF_SECONDS)
+            return
+        took_ms = (time.perf_counter() - t0) * 1000
+        late_ms = (started - deadline).total_seconds() * 1000
+
+        self.stdout.write(f"Tick for {deadline}: {late_ms:.1f} ms after deadline, took {took_ms:.1f} ms")
@@ -1,9 +1,17 @@
 # Generated by Django 5.2.8 on 2025-12-08 12:24
 
-import api.models
+import secrets
+import string
+
 from django.db import migrations, models
 
 
+def generate_unique_ticket_code():
+    """Random code; the field's default at this point in history (later migrations replace it)."""
+    chars = string.ascii_uppercase + string.digits
+    return ''.join(secrets.choice(chars) for _ in range(8))
+
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -18,6 +26,6 @@ class Migration(migrations.Migration):
         migrations.AddField(
             model_name='ticket',
             name='ticket_code',
-            field=models.CharField(db_index=True, default=api.models.generate_unique_ticket_code, max_length=8, unique=True),
+            field=models.CharField(db_index=True, default=generate_unique_ticket_code, max_length=8, unique=True),
         ),
     ]
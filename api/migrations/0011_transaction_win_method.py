@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_alter_profile_avatar'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='method',
+            field=models.CharField(choices=[('USDT', 'USDT'), ('BANK', 'Bank Transfer'), ('WIN', 'Round Winnings')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:02
+
+from django.db import migrations, models
+
+from api.bitmask import numbers_to_mask
+
+
+def backfill_open_rounds(apps, schema_editor):
+    """Settled rounds never read their mask again, so only fill open ones."""
+    Round = apps.get_model('api', 'Round')
+    Ticket = apps.get_model('api', 'Ticket')
+    for round_obj in Round.objects.filter(is_finished=False):
+        played = set()
+        for numbers in Ticket.objects.filter(round=round_obj).values_list('numbers', flat=True):
+            played.update(numbers)
+        round_obj.played_mask_lo, round_obj.played_mask_hi = numbers_to_mask(played)
+        round_obj.save(update_fields=['played_mask_lo', 'played_mask_hi'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_transaction_win_method'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='round',
+            name='played_mask_hi',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='round',
+            name='played_mask_lo',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_open_rounds, migrations.RunPython.noop),
+    ]
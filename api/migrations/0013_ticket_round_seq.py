@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+def backfill_round_seq(apps, schema_editor):
+    """Number existing tickets 1..n per round in creation order."""
+    Round = apps.get_model('api', 'Round')
+    Ticket = apps.get_model('api', 'Ticket')
+    for round_obj in Round.objects.all():
+        ticket_ids = list(Ticket.objects.filter(round=round_obj).order_by('id').values_list('id', flat=True))
+        for seq, ticket_id in enumerate(ticket_ids, start=1):
+            Ticket.objects.filter(id=ticket_id).update(round_seq=seq)
+        round_obj.ticket_seq = len(ticket_ids)
+        round_obj.save(update_fields=['ticket_seq'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_round_played_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='round',
+            name='ticket_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='round_seq',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_round_seq, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ticket',
+            constraint=models.UniqueConstraint(fields=('round', 'round_seq'), name='unique_ticket_round_seq'),
+        ),
+    ]
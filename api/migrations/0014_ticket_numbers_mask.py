@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:25
+
+from django.db import migrations, models
+
+from api.bitmask import numbers_to_mask
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+def backfill_numbers_mask(apps, schema_editor):
+    Ticket = apps.get_model('api', 'Ticket')
+    batch = []
+    for ticket in Ticket.objects.only('id', 'numbers').iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        ticket.numbers_mask_lo, ticket.numbers_mask_hi = numbers_to_mask(ticket.numbers)
+        batch.append(ticket)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            Ticket.objects.bulk_update(batch, ['numbers_mask_lo', 'numbers_mask_hi'])
+            batch = []
+    if batch:
+        Ticket.objects.bulk_update(batch, ['numbers_mask_lo', 'numbers_mask_hi'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_ticket_round_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='numbers_mask_hi',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='numbers_mask_lo',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_numbers_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_ticket_numbers_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundExposure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('combo', models.CharField(max_length=11)),
+                ('size', models.PositiveSmallIntegerField()),
+                ('stake', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tickets', models.PositiveIntegerField(default=0)),
+                ('round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exposures', to='api.round')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('round', 'combo'), name='unique_round_exposure_combo')],
+            },
+        ),
+    ]
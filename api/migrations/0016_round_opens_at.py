@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_roundexposure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='round',
+            name='opens_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
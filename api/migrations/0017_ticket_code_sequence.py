@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:58
+
+import api.ticket_codes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_round_opens_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='ticket_code',
+            field=models.CharField(db_index=True, default=api.ticket_codes.allocate_ticket_code, max_length=8, unique=True),
+        ),
+    ]
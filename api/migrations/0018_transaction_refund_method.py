@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_ticket_code_sequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='method',
+            field=models.CharField(choices=[('USDT', 'USDT'), ('BANK', 'Bank Transfer'), ('WIN', 'Round Winnings'), ('REFUND', 'Late Play Refund')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_transaction_refund_method'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='ticket_user_history_idx'),
+        ),
+    ]
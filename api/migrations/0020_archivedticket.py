@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_ticket_user_history_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTicket',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('ticket_code', models.CharField(max_length=8, unique=True)),
+                ('numbers', models.JSONField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('winning', models.BooleanField(default=False)),
+                ('win_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField()),
+                ('round_seq', models.PositiveIntegerField(blank=True, null=True)),
+                ('round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_tickets', to='api.round')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_tickets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at', 'id'], name='archived_user_history_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:58
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_ticket_counters(apps, schema_editor):
+    """Count existing tickets, live and archived, into their rounds."""
+    Round = apps.get_model('api', 'Round')
+    totals = {}
+    for model_name in ('Ticket', 'ArchivedTicket'):
+        model = apps.get_model('api', model_name)
+        rows = model.objects.order_by().values('round_id').annotate(count=Count('id'), stake=Sum('amount'))
+        for row in rows:
+            count, stake = totals.get(row['round_id'], (0, Decimal(0)))
+            totals[row['round_id']] = (count + row['count'], stake + row['stake'])
+    for round_id, (count, stake) in totals.items():
+        Round.objects.filter(pk=round_id).update(tickets_count=count, total_stake=stake)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_archivedticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='round',
+            name='tickets_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='round',
+            name='total_stake',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(backfill_ticket_counters, migrations.RunPython.noop),
+    ]
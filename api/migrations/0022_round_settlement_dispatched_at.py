@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_round_ticket_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='round',
+            name='settlement_dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
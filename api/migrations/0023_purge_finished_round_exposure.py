@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:20
+
+from django.db import migrations
+
+
+def purge_finished_round_exposure(apps, schema_editor):
+    RoundExposure = apps.get_model("api", "RoundExposure")
+    RoundExposure.objects.filter(round__is_finished=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_round_settlement_dispatched_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(purge_finished_round_exposure, migrations.RunPython.noop),
+    ]
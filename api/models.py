@@ -1,16 +1,75 @@
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
 import uuid
+import random
 import secrets
+from itertools import combinations
 from datetime import timedelta
 import string
 from django.utils import timezone
 from django.db import models
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .bitmask import number_bit, numbers_to_mask, mask_to_numbers
+from .ticket_codes import allocate_ticket_code
 
 
 
 
 
+# ======================================
+
+
+def add_and_fetch(model, pk, field, amount, **conditions):
+    """
+    Add `amount` to `field` of one row and return the new value, or None if
+    the row does not exist or does not match `conditions` (field=value pairs).
+    A single UPDATE ... RETURNING where the backend has it, otherwise the
+    UPDATE and a read in one transaction.
+    """
+    if connection.vendor == "postgresql" or (
+        connection.vendor == "sqlite" and connection.features.can_return_columns_from_insert
+    ):
+        qn = connection.ops.quote_name
+        column = qn(model._meta.get_field(field).column)
+        where = [f"{qn(model._meta.pk.column)} = %s"]
+        params = [amount, pk]
+        for name, value in conditions.items():
+            where.append(f"{qn(model._meta.get_field(name).column)} = %s")
+            params.append(value)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(model._meta.db_table)} SET {column} = {column} + %s "
+                f"WHERE {' AND '.join(where)} RETURNING {column}",
+                params,
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    with transaction.atomic():
+        if not model.objects.filter(pk=pk, **conditions).update(**{field: F(field) + amount}):
+            return None
+        return model.objects.values_list(field, flat=True).get(pk=pk)
+
+
+class Sequence(models.Model):
+    """A named counter, see add_and_fetch and api/ticket_codes.py."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def add_and_fetch(cls, name, amount):
+        value = add_and_fetch(cls, name, "value", amount)
+        if value is None:
+            cls.objects.get_or_create(name=name)
+            value = add_and_fetch(cls, name, "value", amount)
+        return value
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 # ======================================
 
 
@@ -50,7 +109,10 @@ class Profile(models.Model):
         self.withdrawal_info_submitted_at = timezone.now()
         self.withdrawal_info_approved = False
         self.withdrawal_info_approved_at = None
-        self.save()
+        self.save(update_fields=[
+            "bank_account_number", "bank_name",
+            "withdrawal_info_submitted_at", "withdrawal_info_approved", "withdrawal_info_approved_at",
+        ])
 
     def can_withdraw(self):
         """Check if withdrawal is allowed."""
@@ -63,12 +125,10 @@ class Profile(models.Model):
         """Withdraw using saved bank info."""
         if not self.can_withdraw():
             raise ValueError("Cannot withdraw yet")
-        if amount > self.balance:
-            raise ValueError("Insufficient balance")
         if not (self.user.first_name and self.user.last_name and self.bank_account_number and self.bank_name):
             raise ValueError("Bank info incomplete")
-        self.balance -= amount
-        self.save()
+        if not self.debit(amount):
+            raise ValueError("Insufficient balance")
         # Optionally: trigger actual bank transfer here using saved info
         return {
             "account_name": f"{self.user.first_name} {self.user.last_name}".strip(),
@@ -77,11 +137,26 @@ class Profile(models.Model):
             "amount": amount
         }
 
+    def debit(self, amount):
+        """
+        Take amount off the balance with a single
+        UPDATE ... SET balance = balance - amount WHERE balance >= amount,
+        so concurrent debits can neither overdraw nor overwrite each other.
+        Returns False, leaving the balance untouched, if it does not cover amount.
+        """
+        if amount <= 0:
+            raise ValueError("Amount must be positive")
+        debited = Profile.objects.filter(pk=self.pk, balance__gte=amount).update(balance=F("balance") - amount)
+        if debited:
+            self.balance -= amount
+        return bool(debited)
+
     def add_funds(self, amount):
+        """Credit amount with a single UPDATE, like debit, so it cannot undo a concurrent debit."""
         if amount <= 0:
             raise ValueError("Amount must be positive")
+        Profile.objects.filter(pk=self.pk).update(balance=F("balance") + amount)
         self.balance += amount
-        self.save()
 
     # ------------------------------
     # Email verification (unchanged)
@@ -96,7 +171,8 @@ class Profile(models.Model):
     def mark_email_verified(self):
         self.is_email_verified = True
         self.email_verification_token = None
-        self.save()
+        # Not the balance: a full save would overwrite concurrent credits and debits
+        self.save(update_fields=["is_email_verified", "email_verification_token"])
 
     # ------------------------------
     # String representation
@@ -167,6 +243,8 @@ class Transaction(models.Model):
     TRANSACTION_METHODS = [
         ('USDT', 'USDT'),
         ('BANK', 'Bank Transfer'),
+        ('WIN', 'Round Winnings'),
+        ('REFUND', 'Late Play Refund'),
     ]
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -187,14 +265,120 @@ class Transaction(models.Model):
 
 
 
+RANDOM_TICKET_ATTEMPTS = 8
+
+
+class RoundQuerySet(models.QuerySet):
+    def scheduled(self):
+        """Pre-allocated rounds the scheduler has not opened yet."""
+        return self.filter(is_accepting=False, is_finished=False, draw__isnull=True, opens_at__isnull=False)
+
+    def next_scheduled(self, now=None):
+        """The next pre-allocated round still due to open, if any."""
+        now = now or timezone.now()
+        return self.scheduled().filter(accept_until__gt=now).order_by("opens_at").first()
+
+    def add_tickets(self, count, stake):
+        """Atomically count `count` new tickets worth `stake` in total on these rounds."""
+        return self.update(tickets_count=F("tickets_count") + count, total_stake=F("total_stake") + stake)
+
+    def repair_ticket_counters(self):
+        """
+        Recompute tickets_count and total_stake from the tickets (archived
+        ones included) of the rounds whose counters are off. Returns how many
+        were fixed. Each round is recounted inside its own UPDATE, so
+        purchases running at the same time are not lost.
+        """
+        def per_round(model, aggregate, default):
+            rows = model.objects.filter(round=OuterRef("pk")).order_by().values("round").annotate(value=aggregate)
+            return Coalesce(Subquery(rows.values("value")), default)
+
+        stake_field = Round._meta.get_field("total_stake")
+        actual_count = per_round(Ticket, Count("id"), 0) + per_round(ArchivedTicket, Count("id"), 0)
+        actual_stake = ExpressionWrapper(
+            per_round(Ticket, Sum("amount"), Value(0, output_field=stake_field))
+            + per_round(ArchivedTicket, Sum("amount"), Value(0, output_field=stake_field)),
+            output_field=stake_field,
+        )
+        stale = self.alias(actual_count=actual_count, actual_stake=actual_stake).filter(
+            ~Q(tickets_count=F("actual_count")) | ~Q(total_stake=F("actual_stake"))
+        ).values_list("pk", flat=True)
+        return Round.objects.filter(pk__in=list(stale)).update(tickets_count=actual_count, total_stake=actual_stake)
+
+
 class Round(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_accepting = models.BooleanField(default=True)
     is_finished = models.BooleanField(default=False)
+    # Start of the play window for pre-allocated rounds (null for rounds opened on the spot)
+    opens_at = models.DateTimeField(null=True, blank=True)
     accept_until = models.DateTimeField(null=True, blank=True)
     draw = models.JSONField(null=True, blank=True)  
     no_match_draws = models.IntegerField(default=0)  
 
+    # Every number played in this round, see api/bitmask.py
+    played_mask_lo = models.BigIntegerField(default=0)
+    played_mask_hi = models.BigIntegerField(default=0)
+    # Last Ticket.round_seq handed out in this round
+    ticket_seq = models.PositiveIntegerField(default=0)
+    # Tickets created in this round and their stakes, counted as they are
+    # created (RoundQuerySet.add_tickets) so status reads need no COUNT.
+    # Archiving tickets leaves them as they are.
+    tickets_count = models.PositiveIntegerField(default=0)
+    total_stake = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # When settlement was last handed to the workers (fan-out only, see api/tasks.py)
+    settlement_dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    objects = RoundQuerySet.as_manager()
+
+    def add_played_numbers(self, numbers):
+        """Atomically OR a ticket's numbers into the round's coverage mask."""
+        lo, hi = numbers_to_mask(numbers)
+        Round.objects.filter(pk=self.pk).update(
+            played_mask_lo=F("played_mask_lo").bitor(lo),
+            played_mask_hi=F("played_mask_hi").bitor(hi),
+        )
+
+    def played_numbers(self):
+        """Numbers covered by at least one ticket, read fresh from the DB."""
+        lo, hi = Round.objects.values_list("played_mask_lo", "played_mask_hi").get(pk=self.pk)
+        return set(mask_to_numbers(lo, hi))
+
+    def next_ticket_seq(self):
+        """
+        Reserve the next ticket sequence number for this round.
+        Must run inside the transaction that creates the ticket.
+        """
+        seqs = self.reserve_ticket_seqs(1)
+        return seqs[0] if seqs else None
+
+    def reserve_ticket_seqs(self, count):
+        """
+        Reserve `count` consecutive sequence numbers, same rules as next_ticket_seq.
+        Returns None if the round has stopped accepting plays.
+        """
+        last = add_and_fetch(Round, self.pk, "ticket_seq", count, is_accepting=True)
+        if last is None:
+            return None
+        return range(last - count + 1, last + 1)
+
+    def random_ticket(self, attempts=RANDOM_TICKET_ATTEMPTS):
+        """
+        Uniformly random ticket of this round, picked by an indexed lookup on
+        a random round_seq instead of sorting the whole round with ORDER BY RANDOM().
+
+        Sequence numbers of deleted tickets are skipped by drawing again, which
+        keeps the pick uniform over the tickets that remain.
+        """
+        last_seq = Round.objects.values_list("ticket_seq", flat=True).get(pk=self.pk)
+        if last_seq:
+            for _ in range(attempts):
+                ticket = self.tickets.filter(round_seq=random.randint(1, last_seq)).first()
+                if ticket:
+                    return ticket
+        # Heavily gapped or pre-sequence round
+        return self.tickets.order_by("?").first()
+
     def __str__(self):
         return f"Round {self.id} - {'Accepting' if self.is_accepting else 'Closed'}"
 
@@ -208,33 +392,97 @@ class Round(models.Model):
 
 
 
+EXPOSURE_COMBO_SIZE = 3  # smallest winning match count in api.utils.WIN_MULTIPLIER_MAP
+
+
+def exposure_keys(numbers):
+    """Exposure keys a ticket contributes to: each number, then each combination."""
+    numbers = sorted(numbers)
+    keys = [str(n) for n in numbers]
+    keys += ["-".join(map(str, combo)) for combo in combinations(numbers, EXPOSURE_COMBO_SIZE)]
+    return keys
+
+
+class RoundExposure(models.Model):
+    """
+    Running stake total of an open round for one number ("17") or one
+    EXPOSURE_COMBO_SIZE combination ("3-17-42"), kept up to date at purchase
+    time so liability questions never need to scan tickets.
+    """
+    round = models.ForeignKey(Round, on_delete=models.CASCADE, related_name="exposures")
+    combo = models.CharField(max_length=11)
+    size = models.PositiveSmallIntegerField()
+    stake = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tickets = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["round", "combo"], name="unique_round_exposure_combo"),
+        ]
+
+    @classmethod
+    def record(cls, round_obj, numbers, amount):
+        """Add one ticket's stake to every key it touches. Run inside the purchase transaction."""
+        cls.record_many(round_obj, [(numbers, amount)])
+
+    @classmethod
+    def record_many(cls, round_obj, plays):
+        """Same as record for several (numbers, amount) tickets at once."""
+        totals = {}
+        for numbers, amount in plays:
+            for key in exposure_keys(numbers):
+                stake, tickets = totals.get(key, (0, 0))
+                totals[key] = (stake + amount, tickets + 1)
+
+        # Make sure every row exists, then bump the keys sharing an increment with one UPDATE each
+        cls.objects.bulk_create(
+            [cls(round=round_obj, combo=key, size=key.count("-") + 1) for key in totals],
+            ignore_conflicts=True,
+        )
+        by_increment = {}
+        for key, increment in totals.items():
+            by_increment.setdefault(increment, []).append(key)
+        for (stake, tickets), keys in by_increment.items():
+            cls.objects.filter(round=round_obj, combo__in=keys).update(
+                stake=F("stake") + stake,
+                tickets=F("tickets") + tickets,
+            )
+
+    @classmethod
+    def purge(cls, round_id):
+        """Drop a round's counters once it is settled; nothing reads them after that."""
+        cls.objects.filter(round_id=round_id).delete()
+
+    def __str__(self):
+        return f"Round {self.round_id} - {self.combo}: {self.stake}"
+
+
 def generate_ticket_code_for_default():
     """Simple random code for migrations (does not query DB)."""
     chars = string.ascii_uppercase + string.digits
     return ''.join(secrets.choice(chars) for _ in range(8))
 
-def generate_unique_ticket_code():
-    """
-    Production-safe generator that checks DB for uniqueness.
-    Call this only when creating new Ticket objects, not at migration time.
-    """
-    chars = string.ascii_uppercase + string.digits
-    while True:
-        code = ''.join(secrets.choice(chars) for _ in range(8))
-        # Only check DB if table exists
-        try:
-            if not Ticket.objects.filter(ticket_code=code).exists():
-                return code
-        except:
-            # Table might not exist during migration
-            return code
+
+
+class TicketQuerySet(models.QuerySet):
+    def with_matches(self, draw):
+        """
+        Annotate each ticket with `matches`, the number of its numbers in the
+        draw, computed in SQL from the numbers_mask_* columns.
+        """
+        fields = ("numbers_mask_lo", "numbers_mask_hi")
+        matches = Value(0)
+        for n in set(draw):
+            half, bit = number_bit(n)
+            matches = matches + F(fields[half]).bitrightshift(bit).bitand(1)
+        return self.annotate(matches=matches)
 
 
 class Ticket(models.Model):
     ticket_code = models.CharField(
         max_length=8,
         unique=True,
-        default=generate_ticket_code_for_default,  # safe for migrations
+        default=allocate_ticket_code,  # unique by construction, see api/ticket_codes.py
         db_index=True
     )
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tickets")
@@ -244,16 +492,67 @@ class Ticket(models.Model):
     winning = models.BooleanField(default=False)
     win_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # 1-based position of the ticket within its round, see Round.next_ticket_seq
+    round_seq = models.PositiveIntegerField(null=True, blank=True)
+    # `numbers` as a bitmask, see api/bitmask.py
+    numbers_mask_lo = models.BigIntegerField(default=0)
+    numbers_mask_hi = models.BigIntegerField(default=0)
+
+    objects = TicketQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["round", "round_seq"], name="unique_ticket_round_seq"),
+        ]
+        indexes = [
+            # Keyset pagination of a player's history, see TicketHistoryView
+            models.Index(fields=["user", "created_at", "id"], name="ticket_user_history_idx"),
+        ]
+
+    def fill_numbers_mask(self):
+        """Sync the numbers_mask_* columns with `numbers`. bulk_create callers must call this."""
+        self.numbers_mask_lo, self.numbers_mask_hi = numbers_to_mask(self.numbers)
 
     def save(self, *args, **kwargs):
         if not self.ticket_code:
-            self.ticket_code = generate_unique_ticket_code()
-        super().save(*args, **kwargs)
+            self.ticket_code = allocate_ticket_code()
+        self.fill_numbers_mask()
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Round.objects.filter(pk=self.round_id).add_tickets(1, self.amount)
 
     def __str__(self):
         return f"Ticket {self.ticket_code} - User {self.user.username} - Amount {self.amount}"
 
 
+class ArchivedTicket(models.Model):
+    """
+    Tickets of long-settled rounds, moved out of Ticket by `manage.py archive_tickets`
+    so the live table and its indexes only hold recent history. Rows keep
+    their Ticket id; the numbers masks are only used to settle and are dropped.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    ticket_code = models.CharField(max_length=8, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_tickets")
+    round = models.ForeignKey(Round, on_delete=models.CASCADE, related_name="archived_tickets")
+    numbers = models.JSONField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    winning = models.BooleanField(default=False)
+    win_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    created_at = models.DateTimeField()
+    round_seq = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at", "id"], name="archived_user_history_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived ticket {self.ticket_code} - User {self.user_id} - Amount {self.amount}"
+
+
 
 
 
@@ -0,0 +1,87 @@
+# api/purchases.py
+
+"""
+Ticket purchase, shared by the single and batch play endpoints.
+
+A purchase is a fixed number of queries whatever the number of tickets:
+one balance debit, one block of round sequence numbers, one bulk INSERT,
+one coverage update, one ticket counter update and a handful of exposure
+updates. Ticket codes come
+from api/ticket_codes.py and need no uniqueness check.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Round, RoundExposure, Ticket
+from .settlement import apply_credits
+from .ticket_codes import allocate_ticket_codes
+from .ticket_staging import should_stage, stage_tickets
+
+MAX_BATCH_TICKETS = 100
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+class RoundClosed(Exception):
+    pass
+
+
+def buy_tickets(user, round_obj, plays):
+    """
+    Create one ticket per (numbers, amount) in `plays` for `round_obj` and
+    debit their total from the user's balance, all in one transaction.
+    Raises InsufficientBalance if the balance does not cover it, and
+    RoundClosed if the round stopped accepting plays; either way nothing is created.
+
+    Close to accept_until the tickets are staged instead of inserted, see
+    api/ticket_staging.py: they are returned unsaved and reach Ticket on the next flush.
+    """
+    total = sum(amount for _, amount in plays)
+    # Outside the transaction, see TicketCodeAllocator.allocate
+    codes = allocate_ticket_codes(len(plays))
+    staged = should_stage(round_obj, timezone.now())
+
+    with transaction.atomic():
+        if not user.profile.debit(total):
+            raise InsufficientBalance
+        # Conditional on the round still accepting, so a stale cached round cannot take plays
+        seqs = round_obj.reserve_ticket_seqs(len(plays))
+        if seqs is None:
+            raise RoundClosed
+        # A staged play is judged against accept_until by when it was paid for, not when it was written
+        accepted_at = timezone.now()
+
+        tickets = [
+            Ticket(
+                round=round_obj,
+                round_seq=seq,
+                ticket_code=code,
+                user=user,
+                numbers=sorted(numbers),
+                amount=amount,
+            )
+            for (numbers, amount), seq, code in zip(
+                plays, seqs, codes
+            )
+        ]
+        if not staged:
+            for ticket in tickets:
+                ticket.fill_numbers_mask()
+            Ticket.objects.bulk_create(tickets)
+
+            round_obj.add_played_numbers({n for numbers, _ in plays for n in numbers})
+            Round.objects.filter(pk=round_obj.pk).add_tickets(len(tickets), total)
+            RoundExposure.record_many(round_obj, plays)
+
+    if staged:
+        # Only the debit and the sequence numbers went to the main DB
+        try:
+            stage_tickets(tickets, accepted_at)
+        except Exception:
+            apply_credits({user.id: total})
+            raise
+
+    return tickets
@@ -0,0 +1,250 @@
+# api/round_events.py
+
+"""
+Server-Sent Events stream of round transitions: GET /rounds/events/.
+
+Clients keep one connection open instead of polling /rounds/current/.
+Each worker process runs one watcher task, and only while it has
+subscribers. The watcher reads the cached current-round descriptor
+(api/current_round.py) once per ROUND_EVENTS_POLL_SECONDS. It also
+queries the DB while a closed round waits for its draw. Every change
+goes into RoundEventHub, which fans it out to all of the worker's
+streams. So a worker reads the same data per tick however many clients
+it serves.
+
+Event ids are derived from the round (round_id * 4 + kind), so they are
+the same on every worker. They are not in publishing order: a round's
+draw can land after the next round has opened, so streams never skip an
+event for having a lower id than the last one sent. A client that
+reconnects with Last-Event-ID, possibly to another worker, gets the
+events published after that one from the ring buffer of the last
+ROUND_EVENT_BUFFER events. If the buffer no longer reaches back that far,
+it gets a fresh `round.state` snapshot.
+
+EventSource cannot send an Authorization header, so browsers first POST
+to /rounds/events/token/ with their JWT and open the stream with the
+short-lived token it returns (?token=). Query strings end up in access logs
+and proxy logs. The stream token only opens this stream, and only for
+ROUND_EVENTS_TOKEN_SECONDS, so a logged URL is worth little. JWT access
+tokens are never accepted in the query string.
+
+The stream needs an async server on backend/asgi.py (e.g. uvicorn). Under
+WSGI every open stream would hold a worker thread.
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .current_round import current_round_state
+from .models import Round
+
+logger = logging.getLogger(__name__)
+
+ROUND_EVENTS_POLL_SECONDS = 1
+ROUND_EVENT_BUFFER = 64
+HEARTBEAT_SECONDS = 15
+RECONNECT_MILLISECONDS = 3000
+ROUND_EVENTS_TOKEN_SECONDS = 300  # how long a ?token= may be used to (re)connect
+ROUND_EVENTS_TOKEN_SALT = "api.round_events"
+
+OPENED, CLOSED, DRAWN = 1, 2, 3
+EVENT_NAMES = {OPENED: "round.opened", CLOSED: "round.closed", DRAWN: "round.drawn"}
+
+
+def event_id(round_id, kind):
+    return round_id * 4 + kind
+
+
+def format_event(name, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {name}", f"data: {json.dumps(data, cls=DjangoJSONEncoder)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+class RoundEventHub:
+    """This process's fan-out of round events to its open streams."""
+
+    def __init__(self):
+        self.events = deque(maxlen=ROUND_EVENT_BUFFER)  # (id, name, data)
+        self.subscribers = set()
+        self.watcher = None
+        self.open_round = None
+        self.awaiting_draw = set()
+        self.primed = False
+
+    def publish(self, events):
+        for event in events:
+            self.events.append(event)
+            for queue in self.subscribers:
+                queue.put_nowait(event)
+
+    def since(self, last_id):
+        """Buffered events published after last_id, or None if some may have been dropped."""
+        for position, event in enumerate(self.events):
+            if event[0] == last_id:
+                return list(self.events)[position + 1:]
+        # Not buffered here (e.g. a snapshot's id): fall back to comparing ids
+        if not self.events or self.events[0][0] > last_id:
+            return None
+        return [event for event in self.events if event[0] > last_id]
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if self.watcher is None or self.watcher.done() or self.watcher.get_loop() is not loop:
+            self.watcher = loop.create_task(self.watch())
+        queue = asyncio.Queue()
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers and self.watcher is not None:
+            self.watcher.cancel()
+            self.watcher = None
+
+    async def watch(self):
+        while True:
+            try:
+                self.publish(await sync_to_async(self.check)())
+            except Exception:
+                logger.exception("Round event watcher failed")
+            await asyncio.sleep(ROUND_EVENTS_POLL_SECONDS)
+
+    def check(self, now=None):
+        """Events since the previous check. The first check only records where things stand."""
+        state = current_round_state(now or timezone.now())
+        events = []
+
+        if state["round_id"] != self.open_round:
+            if self.primed and self.open_round is not None:
+                events.append((event_id(self.open_round, CLOSED), EVENT_NAMES[CLOSED], {"round_id": self.open_round}))
+                self.awaiting_draw.add(self.open_round)
+            if self.primed and state["round_id"] is not None:
+                events.append((
+                    event_id(state["round_id"], OPENED),
+                    EVENT_NAMES[OPENED],
+                    {"round_id": state["round_id"], "accept_until": state["accept_until"]},
+                ))
+            self.open_round = state["round_id"]
+        self.primed = True
+
+        if self.awaiting_draw:
+            drawn = Round.objects.filter(id__in=self.awaiting_draw, draw__isnull=False).values_list("id", "draw")
+            for round_id, draw in sorted(drawn):
+                events.append((event_id(round_id, DRAWN), EVENT_NAMES[DRAWN], {"round_id": round_id, "draw": draw}))
+                self.awaiting_draw.discard(round_id)
+        # A closed round's draw goes out before the next round's "opened"
+        return sorted(events, key=lambda event: event[0])
+
+
+hub = RoundEventHub()
+
+
+def state_snapshot():
+    """`round.state` event for a client that cannot be caught up from the buffer."""
+    state = current_round_state()
+    data = {
+        "round_id": state["round_id"],
+        "accept_until": state["accept_until"],
+        "next_round_opens_at": state["next_opens_at"],
+    }
+    # Resuming from here only skips this round's own "opened" event
+    last_id = event_id(state["round_id"], OPENED) if state["round_id"] is not None else None
+    return last_id, format_event("round.state", data, last_id)
+
+
+def stream_token(user):
+    return signing.dumps(user.pk, salt=ROUND_EVENTS_TOKEN_SALT)
+
+
+def authenticate(request):
+    """JWT from the Authorization header, or a stream token (stream_token) in ?token=."""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header:
+        return auth.get_user(auth.get_validated_token(auth.get_raw_token(header)))
+
+    token = request.GET.get("token")
+    if not token:
+        raise AuthenticationFailed("Authentication credentials were not provided.")
+    try:
+        user_id = signing.loads(token, salt=ROUND_EVENTS_TOKEN_SALT, max_age=ROUND_EVENTS_TOKEN_SECONDS)
+    except signing.BadSignature:
+        # Expired tokens included; JWTs do not carry this salt's signature either
+        raise AuthenticationFailed("Invalid or expired stream token.")
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None:
+        raise AuthenticationFailed("User not found.")
+    return user
+
+
+class RoundEventsTokenView(APIView):
+    """Short-lived token for opening /rounds/events/ from an EventSource."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return Response({"token": stream_token(request.user), "expires_in": ROUND_EVENTS_TOKEN_SECONDS})
+
+
+async def event_stream(last_id):
+    # Subscribe before reading the backlog so nothing falls between the two
+    queue = hub.subscribe()
+    try:
+        yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+
+        # Events published since subscribing are in the queue as well
+        sent = set()
+        backlog = hub.since(last_id) if last_id is not None else None
+        if backlog is None:
+            snapshot_id, snapshot = await sync_to_async(state_snapshot)()
+            yield snapshot
+            sent.add(snapshot_id)
+            backlog = []
+        for event in backlog:
+            yield format_event(event[1], event[2], event[0])
+            sent.add(event[0])
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event[0] in sent:
+                sent.discard(event[0])
+                continue
+            yield format_event(event[1], event[2], event[0])
+    finally:
+        hub.unsubscribe(queue)
+
+
+async def round_events(request):
+    try:
+        await sync_to_async(authenticate)(request)
+    except (AuthenticationFailed, InvalidToken, TokenError) as exc:
+        return JsonResponse({"detail": str(exc)}, status=401)
+
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.GET["last_event_id"])
+    except (KeyError, ValueError):
+        last_id = None
+
+    response = StreamingHttpResponse(event_stream(last_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # keep nginx from buffering the stream
+    return response
@@ -0,0 +1,121 @@
+# api/round_status.py
+
+"""
+Pre-rendered body of GET /rounds/current/.
+
+The scheduler publishes a snapshot into the cache whenever it opens or
+closes a round. The snapshot holds the rendered JSON bytes, the status
+code and the ETag. CurrentRoundStatusView returns those bytes with only
+time_left_seconds appended (render_status), since that is the one field
+that moves with the clock.
+
+So a snapshot stays valid until the round state changes: until
+accept_until, or until the next round opens. Invalidating the current
+round drops it too. Only tickets_count moves within a round, so an open
+round's snapshot is rebuilt after STATUS_TICKETS_COUNT_SECONDS at most.
+The first request to find it expired takes a short lock in the cache and
+rebuilds it. Everyone else keeps serving the previous bytes meanwhile.
+With no snapshot at all (cold cache), a request builds one inline.
+
+With a per-process cache (LocMem) the scheduler's snapshot never reaches
+the web workers. Each worker then builds its own, once per state change.
+"""
+
+import math
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .conditional import make_etag
+from .current_round import STATUS_SNAPSHOT_KEY, current_round_state
+from .models import Round
+
+STATUS_TICKETS_COUNT_SECONDS = 10  # how far tickets_count may lag behind
+REBUILD_LOCK_KEY = "rounds:current:status:rebuild"
+REBUILD_LOCK_SECONDS = 5
+
+
+def build_status_snapshot(now=None):
+    """
+    {"status", "body", "etag", "accept_until", "retry_at", "valid_until"}
+    for the current round (status 200), or for the break between rounds
+    (status 404, no etag).
+    """
+    now = now or timezone.now()
+    state = current_round_state(now)
+
+    if state["round_id"] is None:
+        data = {"detail": "No active round", "next_round_opens_at": state["next_opens_at"]}
+        return {
+            "status": 404,
+            "body": JSONRenderer().render(data),
+            "etag": None,
+            "accept_until": None,
+            "retry_at": state["next_opens_at"],
+            "valid_until": state["valid_until"],
+        }
+
+    accept_until = state["accept_until"]
+    if timezone.is_naive(accept_until):
+        accept_until = timezone.make_aware(accept_until, timezone.utc)
+    tickets_count = Round.objects.filter(pk=state["round_id"]).values_list("tickets_count", flat=True).first() or 0
+    data = {
+        "id": state["round_id"],
+        "is_accepting": True,
+        "is_finished": False,
+        "accept_until": accept_until,
+        "draw": [],
+        "tickets_count": tickets_count,
+    }
+    return {
+        "status": 200,
+        "body": JSONRenderer().render(data),
+        # Only what changes with the round state: time_left_seconds would change it every second
+        "etag": make_etag("CurrentRoundStatusView", state["round_id"], accept_until, tickets_count, True, []),
+        "accept_until": accept_until,
+        "retry_at": None,
+        "valid_until": min(now + timedelta(seconds=STATUS_TICKETS_COUNT_SECONDS), accept_until),
+    }
+
+
+def time_left(snapshot, now):
+    return max(int((snapshot["accept_until"] - now).total_seconds()), 0)
+
+
+def render_status(snapshot, now):
+    """The snapshot's body as of `now`: an open round gets time_left_seconds added."""
+    if snapshot["accept_until"] is None:
+        return snapshot["body"]
+    # The body is a compact JSON object: splice the field in before its closing brace
+    return snapshot["body"][:-1] + b',"time_left_seconds":%d}' % time_left(snapshot, now)
+
+
+def publish_status_snapshot(now=None):
+    """Render the current status and share it with every worker. Called by the scheduler."""
+    now = now or timezone.now()
+    snapshot = build_status_snapshot(now)
+    # Kept past valid_until so readers have something to serve while it is rebuilt
+    valid_for = max(math.ceil((snapshot["valid_until"] - now).total_seconds()), 0)
+    cache.set(STATUS_SNAPSHOT_KEY, snapshot, valid_for + REBUILD_LOCK_SECONDS)
+    return snapshot
+
+
+def status_snapshot(now=None):
+    """The published snapshot, rebuilt by one request at a time once it has run out."""
+    now = now or timezone.now()
+    snapshot = cache.get(STATUS_SNAPSHOT_KEY)
+    if snapshot is not None and snapshot["valid_until"] > now:
+        return snapshot
+
+    if cache.add(REBUILD_LOCK_KEY, 1, REBUILD_LOCK_SECONDS):
+        try:
+            return publish_status_snapshot(now)
+        finally:
+            cache.delete(REBUILD_LOCK_KEY)
+
+    if snapshot is not None:
+        # Somebody else is rebuilding it: the previous body will do meanwhile
+        return snapshot
+    return build_status_snapshot(now)
@@ -8,6 +8,7 @@ from django.contrib.auth.models import User
 from rest_framework import serializers
 
 from .models import Profile, Ticket, Round
+from .purchases import MAX_BATCH_TICKETS
 from api.models import Profile  
 
 
@@ -48,7 +49,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         profile.email_verification_token = token
         profile.email_verification_sent_at = timezone.now()
         profile.is_email_verified = False
-        profile.save()
+        profile.save(update_fields=["email_verification_token", "email_verification_sent_at", "is_email_verified"])
 
         # Send verification email
         verification_link = f"http://localhost:5173/verify-email/{token}/"
@@ -115,6 +116,14 @@ class ProfileSerializer(serializers.ModelSerializer):
             return obj.avatar.url
         return None
 
+    def update(self, instance, validated_data):
+        # Save only the submitted fields: a full save would write back a
+        # stale balance over concurrent credits and debits
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
 # ==============================================================
 
 
@@ -147,13 +156,20 @@ class PlayRequestSerializer(serializers.Serializer):
     amount = serializers.IntegerField(min_value=1)
 
 
+class BatchPlayRequestSerializer(serializers.Serializer):
+    tickets = serializers.ListField(
+        child=PlayRequestSerializer(),
+        min_length=1,
+        max_length=MAX_BATCH_TICKETS
+    )
+
+
 
 
     
 
 class RoundStatusSerializer(serializers.ModelSerializer):
     time_left_seconds = serializers.SerializerMethodField()
-    tickets_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Round
@@ -165,6 +181,3 @@ class RoundStatusSerializer(serializers.ModelSerializer):
             return 0
         delta = obj.accept_until - timezone.now()
         return max(int(delta.total_seconds()), 0)
-
-    def get_tickets_count(self, obj):
-        return obj.tickets.count()
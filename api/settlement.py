@@ -0,0 +1,119 @@
+# api/settlement.py
+
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+
+from .bitmask import numbers_to_mask
+from .models import Profile, Ticket, Transaction
+
+SETTLEMENT_CHUNK_SIZE = 5000   # rows per bulk_update statement
+CREDIT_CHUNK_SIZE = 500        # profiles per set-based balance UPDATE
+
+
+def mask_match_counts(masks_lo, masks_hi, draw):
+    """
+    Count, for every ticket mask pair, how many of its numbers appear in the
+    draw. Returns an int array the length of the inputs.
+    """
+    draw_lo, draw_hi = numbers_to_mask(draw)
+    return np.bitwise_count(masks_lo & draw_lo) + np.bitwise_count(masks_hi & draw_hi)
+
+
+def multiplier_table(multiplier_map, width):
+    """Turn {matches: multiplier} into an array indexed by match count."""
+    table = np.zeros(width + 1, dtype=np.int64)
+    for matches, multiplier in multiplier_map.items():
+        if matches <= width:
+            table[matches] = multiplier
+    return table
+
+
+def settle_tickets(tickets, draw, multiplier_map, chunk_size=SETTLEMENT_CHUNK_SIZE):
+    """
+    Settle every ticket in the queryset against the draw in one pass.
+
+    Tickets left winning by an earlier settlement are reset with a single
+    UPDATE, then the winners are written back with chunked bulk_update.
+
+    Returns a list of (ticket_id, user_id, win_amount) for the winning tickets.
+    """
+    rows = list(tickets.values_list("id", "user_id", "numbers_mask_lo", "numbers_mask_hi", "amount"))
+    if not rows:
+        return []
+
+    ids, user_ids, masks_lo, masks_hi = (
+        np.fromiter((r[i] for r in rows), dtype=np.int64, count=len(rows)) for i in range(4)
+    )
+    # Work in kobo/cents so the maths stays exact in int64
+    stakes = np.fromiter((int(r[4] * 100) for r in rows), dtype=np.int64, count=len(rows))
+
+    matches = mask_match_counts(masks_lo, masks_hi, draw)
+    win_cents = stakes * multiplier_table(multiplier_map, len(set(draw)))[matches]
+    winner_idx = np.flatnonzero(win_cents)
+
+    winners = [
+        (int(ids[i]), int(user_ids[i]), Decimal(int(win_cents[i])) / 100)
+        for i in winner_idx
+    ]
+
+    with transaction.atomic():
+        tickets.filter(winning=True).update(winning=False, win_amount=0)
+        for start in range(0, len(winners), chunk_size):
+            Ticket.objects.bulk_update(
+                [
+                    Ticket(id=ticket_id, winning=True, win_amount=win_amount)
+                    for ticket_id, _, win_amount in winners[start:start + chunk_size]
+                ],
+                ["winning", "win_amount"],
+            )
+
+    return winners
+
+
+def apply_credits(totals, chunk_size=CREDIT_CHUNK_SIZE):
+    """Add {user_id: amount} to the users' balances with one CASE-based UPDATE per chunk of users."""
+    user_ids = sorted(totals)
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        credit = Case(
+            *[When(user_id=user_id, then=Value(totals[user_id])) for user_id in chunk],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        Profile.objects.filter(user_id__in=chunk).update(balance=F("balance") + credit)
+
+
+def credit_winners(round_obj, winners, chunk_size=CREDIT_CHUNK_SIZE):
+    """
+    Credit settled winnings to the winners' profiles.
+
+    Winnings are summed per user and applied with apply_credits, together
+    with one COMPLETED "WIN" Transaction per user, all inside a single DB
+    transaction.
+
+    Returns {user_id: total credited}.
+    """
+    totals = defaultdict(Decimal)
+    for _, user_id, win_amount in winners:
+        totals[user_id] += win_amount
+
+    with transaction.atomic():
+        apply_credits(totals, chunk_size)
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    user_id=user_id,
+                    amount=total,
+                    method="WIN",
+                    status="COMPLETED",
+                    reference=f"WIN-{round_obj.id}-{user_id}",
+                )
+                for user_id, total in sorted(totals.items())
+            ],
+            batch_size=chunk_size,
+        )
+
+    return dict(totals)
@@ -0,0 +1,123 @@
+# api/tasks.py
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .lottery_settings import CYCLE_KEY, get_lottery_settings, set_value
+from .models import Round, RoundExposure, Ticket
+from .settlement import settle_tickets, credit_winners
+from .utils import choose_draw, next_cycle
+
+logger = logging.getLogger(__name__)
+
+# Both tasks can safely run again: chunks recompute the same results from
+# the stored draw, and the callback only credits a round it finishes itself.
+SETTLEMENT_TASK_OPTIONS = {
+    "acks_late": True,
+    "reject_on_worker_lost": True,  # redeliver the task if its worker dies
+    "autoretry_for": (DatabaseError,),
+    "retry_backoff": True,
+    "max_retries": 5,
+}
+
+
+def dispatch_settlement(round_obj, rounds_played, chunk_size):
+    """
+    Close a round and settle it across Celery workers.
+
+    The draw is picked here and saved together with the closed round and
+    the next cycle counter, so the next round is drawn with the right cycle
+    while this one is still settling. Tickets are then settled by one
+    settle_round_chunk task per ticket-id range, run as a chord whose
+    callback credits the winners and marks the round finished.
+
+    If the chord fails, the round keeps its draw and stays unfinished until
+    resume_stalled_settlements dispatches it again.
+    """
+    draw = choose_draw(round_obj, rounds_played)
+    with transaction.atomic():
+        round_obj.draw = list(draw)
+        round_obj.is_accepting = False
+        round_obj.settlement_dispatched_at = timezone.now()
+        round_obj.save(update_fields=["draw", "is_accepting", "settlement_dispatched_at"])
+        set_value(CYCLE_KEY, next_cycle(rounds_played))
+        transaction.on_commit(lambda: launch_settlement(round_obj.id, round_obj.draw, chunk_size))
+
+
+def launch_settlement(round_id, draw, chunk_size):
+    """Start the chord that settles a closed round with its stored draw."""
+    callback = finish_settlement.s(round_id).on_error(settlement_failed.s(round_id=round_id))
+    bounds = Ticket.objects.filter(round_id=round_id).aggregate(first=Min("id"), last=Max("id"))
+    if bounds["first"] is None:
+        return callback.delay([])
+
+    header = [
+        settle_round_chunk.s(round_id, draw, first_id, min(first_id + chunk_size - 1, bounds["last"]))
+        for first_id in range(bounds["first"], bounds["last"] + 1, chunk_size)
+    ]
+    return chord(header)(callback)
+
+
+def resume_stalled_settlements(now=None):
+    """
+    Dispatch again every round that was closed with a draw but has not
+    finished SETTLEMENT_STALL_SECONDS after its settlement was dispatched.
+    Returns the ids of the rounds dispatched.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.SETTLEMENT_STALL_SECONDS)
+    stalled = list(
+        Round.objects.filter(
+            draw__isnull=False,
+            is_finished=False,
+            is_accepting=False,
+            settlement_dispatched_at__lt=cutoff,
+        ).values_list("id", "draw")
+    )
+    for round_id, draw in stalled:
+        Round.objects.filter(pk=round_id).update(settlement_dispatched_at=now)
+        logger.warning("Settlement of round #%s stalled, dispatching it again", round_id)
+        launch_settlement(round_id, draw, settings.SETTLEMENT_CHUNK_TICKETS)
+    return [round_id for round_id, _ in stalled]
+
+
+@shared_task(**SETTLEMENT_TASK_OPTIONS)
+def settle_round_chunk(round_id, draw, first_id, last_id):
+    """Settle the round's tickets with ids in [first_id, last_id]."""
+    tickets = Ticket.objects.filter(round_id=round_id, id__gte=first_id, id__lte=last_id)
+    winners = settle_tickets(tickets, draw, get_lottery_settings().win_multipliers)
+    # Decimals are not JSON serializable
+    return [[ticket_id, user_id, str(win_amount)] for ticket_id, user_id, win_amount in winners]
+
+
+@shared_task(**SETTLEMENT_TASK_OPTIONS)
+def finish_settlement(chunk_results, round_id):
+    """Chord callback: credit all chunks' winners and close out the round."""
+    winners = [
+        (ticket_id, user_id, Decimal(win_amount))
+        for chunk in chunk_results
+        for ticket_id, user_id, win_amount in chunk
+    ]
+    round_obj = Round.objects.get(pk=round_id)
+
+    with transaction.atomic():
+        # A resumed settlement may finish the round twice; only the first one credits
+        if not Round.objects.filter(pk=round_id, is_finished=False).update(is_finished=True, is_accepting=False):
+            return 0
+        credit_winners(round_obj, winners)
+        RoundExposure.purge(round_id)
+
+    return len(winners)
+
+
+@shared_task
+def settlement_failed(request, exc, traceback, round_id):
+    """Chord error callback. The round is left for resume_stalled_settlements."""
+    logger.error("Settlement of round #%s failed in task %s: %r", round_id, request.id, exc)
@@ -1,3 +1,998 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .bitmask import numbers_to_mask, mask_to_numbers
+from .conditional import FINAL_MAX_AGE
+from .current_round import STATUS_SNAPSHOT_KEY, invalidate_current_round
+from .round_status import publish_status_snapshot
+from . import archive, lottery_settings, round_events, round_status, ticket_codes, ticket_staging
+from .ticket_cache import settled_tickets
+from .management.commands.manage_rounds import UPCOMING_ROUNDS
+from .management.commands.run_rounds import Command as RunRoundsCommand
+
+from .models import ArchivedTicket, BankWithdrawal, LotterySettings, Profile, Round, RoundExposure, Sequence, Ticket, Transaction
+from .serializers import ProfileSerializer, TicketSerializer
+from .views import AdminRejectWithdrawalView
+from .settlement import settle_tickets, credit_winners
+from .tasks import dispatch_settlement, finish_settlement, resume_stalled_settlements
+from .draw_optimizer import (
+    build_exposure_tables, choose_draw_by_exposure, load_ticket_matrix, score_draws, subset_coefficients,
+)
+from .utils import WIN_MULTIPLIER_MAP, CYCLE_KEY, TOTAL_LOSE_ROUNDS, finalize_round
+
+
+def make_user(username, balance=0):
+    user = User.objects.create_user(username=username, password="x")
+    Profile.objects.create(user=user, balance=balance)
+    return user
+
+
+def make_round(**kwargs):
+    kwargs.setdefault("accept_until", timezone.now() + timedelta(minutes=3))
+    return Round.objects.create(**kwargs)
+
+
+def make_ticket(user, round_obj, numbers, amount=100):
+    return Ticket.objects.create(user=user, round=round_obj, numbers=numbers, amount=amount)
+
+
+class SettlementTests(TestCase):
+    def setUp(self):
+        self.user = make_user("player")
+        self.round = make_round()
+
+    def test_every_ticket_is_matched_against_the_draw(self):
+        three = make_ticket(self.user, self.round, [1, 2, 3, 50, 51, 52])
+        six = make_ticket(self.user, self.round, [1, 2, 3, 4, 5, 6], amount=10)
+        none = make_ticket(self.user, self.round, [60, 61, 62, 63, 64, 65])
+
+        winners = settle_tickets(Ticket.objects.filter(round=self.round), [1, 2, 3, 4, 5, 6], WIN_MULTIPLIER_MAP)
+
+        self.assertEqual(
+            sorted(winners),
+            [(three.id, self.user.id, Decimal("500")), (six.id, self.user.id, Decimal("500"))],
+        )
+        none.refresh_from_db()
+        six.refresh_from_db()
+        self.assertFalse(none.winning)
+        self.assertTrue(six.winning)
+        self.assertEqual(six.win_amount, Decimal("500"))
+
+    def test_winnings_are_credited_once_per_user(self):
+        other = make_user("other")
+        winners = [(1, self.user.id, Decimal("500")), (2, self.user.id, Decimal("70")), (3, other.id, Decimal("5"))]
+
+        totals = credit_winners(self.round, winners, chunk_size=1)
+
+        self.assertEqual(totals, {self.user.id: Decimal("570"), other.id: Decimal("5")})
+        self.user.profile.refresh_from_db()
+        other.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, Decimal("570"))
+        self.assertEqual(other.profile.balance, Decimal("5"))
+        self.assertEqual(Transaction.objects.filter(method="WIN", status="COMPLETED").count(), 2)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class SettlementFanoutTests(TestCase):
+    def make_round_with_tickets(self):
+        user = make_user("player")
+        round_obj = make_round()
+        tickets = [make_ticket(user, round_obj, [1, 2, 3, 4, 5, n]) for n in range(6, 16)]
+        for seq, ticket in enumerate(tickets, start=1):
+            Ticket.objects.filter(pk=ticket.pk).update(round_seq=seq)
+        Round.objects.filter(pk=round_obj.pk).update(ticket_seq=len(tickets))
+        return user, round_obj
+
+    def test_chunks_are_settled_and_aggregated(self):
+        user, round_obj = self.make_round_with_tickets()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch_settlement(round_obj, TOTAL_LOSE_ROUNDS, chunk_size=3)
+
+        round_obj.refresh_from_db()
+        self.assertTrue(round_obj.is_finished)
+        self.assertFalse(round_obj.is_accepting)
+        # The winning round draws 3 numbers from one ticket, and every ticket shares 1-5
+        self.assertEqual(Ticket.objects.filter(round=round_obj, winning=False).count(), 0)
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.balance, sum(t.win_amount for t in Ticket.objects.filter(round=round_obj)))
+        self.assertEqual(LotterySettings.objects.get(key=CYCLE_KEY).value, 1)
+
+    def test_stalled_settlement_is_resumed_once(self):
+        user, round_obj = self.make_round_with_tickets()
+
+        # The chord never runs, e.g. a worker was lost
+        with mock.patch("api.tasks.launch_settlement"), self.captureOnCommitCallbacks(execute=True):
+            dispatch_settlement(round_obj, TOTAL_LOSE_ROUNDS, chunk_size=3)
+
+        round_obj.refresh_from_db()
+        self.assertIsNotNone(round_obj.draw)
+        self.assertFalse(round_obj.is_finished)
+        # The next round already gets the next cycle
+        self.assertEqual(LotterySettings.objects.get(key=CYCLE_KEY).value, 1)
+        self.assertEqual(resume_stalled_settlements(), [])
+
+        later = round_obj.settlement_dispatched_at + timedelta(seconds=settings.SETTLEMENT_STALL_SECONDS + 1)
+        self.assertEqual(resume_stalled_settlements(later), [round_obj.id])
+
+        round_obj.refresh_from_db()
+        self.assertTrue(round_obj.is_finished)
+        user.profile.refresh_from_db()
+        winnings = sum(t.win_amount for t in Ticket.objects.filter(round=round_obj))
+        self.assertEqual(user.profile.balance, winnings)
+
+        # A late callback from the first dispatch credits nothing more
+        finish_settlement([[[0, user.id, str(winnings)]]], round_obj.id)
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.balance, winnings)
+        self.assertEqual(LotterySettings.objects.get(key=CYCLE_KEY).value, 1)
+
+
+class PlayTicketTests(TestCase):
+    def setUp(self):
+        self.user = make_user("player", balance=1000)
+        self.round = make_round()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def play(self, numbers, amount=100):
+        return self.client.post("/play/", {"numbers": numbers, "amount": amount}, format="json")
+
+    def test_purchase_updates_round_coverage(self):
+        self.assertEqual(self.play([1, 2, 3, 45, 46, 90]).status_code, 201)
+        self.assertEqual(self.play([2, 3, 4, 5, 6, 7]).status_code, 201)
+
+        self.assertEqual(self.round.played_numbers(), {1, 2, 3, 4, 5, 6, 7, 45, 46, 90})
+
+    def test_purchases_get_sequential_round_seq(self):
+        self.play([1, 2, 3, 4, 5, 6])
+        self.play([1, 2, 3, 4, 5, 7])
+
+        self.assertEqual(list(self.round.tickets.order_by("id").values_list("round_seq", flat=True)), [1, 2])
+        self.round.refresh_from_db()
+        self.assertEqual(self.round.ticket_seq, 2)
+
+
+    def test_purchase_updates_exposure(self):
+        self.play([1, 2, 3, 4, 5, 6], amount=100)
+        self.play([1, 2, 3, 7, 8, 9], amount=50)
+
+        exposures = dict(RoundExposure.objects.filter(round=self.round).values_list("combo", "stake"))
+        self.assertEqual(len(exposures), 9 + 2 * 20 - 1)
+        self.assertEqual(exposures["1"], 150)
+        self.assertEqual(exposures["9"], 50)
+        self.assertEqual(exposures["1-2-3"], 150)
+
+        admin = User.objects.create_user(username="ops", password="x", is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get(f"/rounds/{self.round.id}/exposure/?limit=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["top_combos"][0]["numbers"], [1, 2, 3])
+        self.assertEqual(response.data["top_combos"][0]["min_payout_if_drawn"], 750)
+        self.assertEqual(len(response.data["numbers"]), 9)
+        self.assertEqual(self.client.get(f"/rounds/{self.round.id}/exposure/?limit=-1").status_code, 400)
+
+        finalize_round(self.round, 0)
+        self.assertFalse(RoundExposure.objects.filter(round=self.round).exists())
+
+
+class ProfileDebitTests(TestCase):
+    def test_debit_never_overdraws(self):
+        profile = make_user("player", balance=150).profile
+
+        self.assertTrue(profile.debit(100))
+        self.assertFalse(profile.debit(100))
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.balance, 50)
+
+    def test_stale_instance_cannot_overwrite_a_concurrent_debit(self):
+        user = make_user("player", balance=100)
+        first, second = Profile.objects.get(user=user), Profile.objects.get(user=user)
+
+        self.assertTrue(first.debit(60))
+        # `second` still believes the balance is 100
+        self.assertFalse(second.debit(60))
+        self.assertEqual(Profile.objects.get(user=user).balance, 40)
+
+    def test_credit_keeps_a_concurrent_debit(self):
+        user = make_user("player", balance=100)
+        stale = Profile.objects.get(user=user)
+
+        self.assertTrue(Profile.objects.get(user=user).debit(60))
+        stale.add_funds(25)
+        stale.mark_email_verified()
+        stale.submit_bank_info("0123456789", "Test Bank")
+        serializer = ProfileSerializer(stale, data={"bank_name": "Other Bank"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(Profile.objects.get(user=user).balance, 65)
+
+    def test_debit_rejects_non_positive_amounts(self):
+        profile = make_user("player", balance=100).profile
+
+        for amount in (0, -50):
+            with self.assertRaises(ValueError):
+                profile.debit(amount)
+        self.assertEqual(Profile.objects.get(pk=profile.pk).balance, 100)
+
+    def test_rejected_withdrawal_is_refunded_once(self):
+        user = make_user("player", balance=100)
+        withdrawal = BankWithdrawal.objects.create(user=user, amount=40)
+        admin = User.objects.create_user(username="ops", password="x", is_staff=True)
+        view = AdminRejectWithdrawalView.as_view()
+
+        for expected in (200, 404):
+            request = APIRequestFactory().post(f"/withdrawals/{withdrawal.reference}/reject/")
+            force_authenticate(request, user=admin)
+            self.assertEqual(view(request, reference=withdrawal.reference).status_code, expected)
+        self.assertEqual(Profile.objects.get(user=user).balance, 140)
+
+    def test_play_rejected_without_funds(self):
+        user = make_user("player", balance=50)
+        round_obj = make_round()
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post("/play/", {"numbers": [1, 2, 3, 4, 5, 6], "amount": 100}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(round_obj.tickets.exists())
+        self.assertEqual(round_obj.played_numbers(), set())
+
+
+class TicketCodeTests(TestCase):
+    def test_codes_are_distinct_and_well_formed(self):
+        key = ticket_codes._round_key("test")
+        codes = {ticket_codes.encode(ticket_codes.permute(n, key)) for n in range(20000)}
+
+        self.assertEqual(len(codes), 20000)
+        self.assertTrue(all(len(c) == 8 and set(c) <= set(ticket_codes.ALPHABET) for c in codes))
+        self.assertNotEqual(
+            ticket_codes.permute(1, key), ticket_codes.permute(1, ticket_codes._round_key("other")),
+        )
+
+    def test_blocks_do_not_overlap(self):
+        first, second = ticket_codes.TicketCodeAllocator(block_size=3), ticket_codes.TicketCodeAllocator(block_size=3)
+
+        codes = first.allocate(4) + second.allocate(4) + first.allocate(2)
+
+        self.assertEqual(len(set(codes)), 10)
+
+    def test_codes_held_by_legacy_tickets_are_skipped(self):
+        allocator = ticket_codes.TicketCodeAllocator(block_size=5)
+        key = ticket_codes._round_key(settings.TICKET_CODE_KEY)
+        start = Sequence.objects.filter(name=ticket_codes.CODE_SEQUENCE).values_list("value", flat=True).first() or 0
+        legacy = ticket_codes.encode(ticket_codes.permute(start + 1, key))
+        Ticket.objects.create(
+            user=make_user("player"), round=make_round(), numbers=[1, 2, 3, 4, 5, 6], amount=100, ticket_code=legacy,
+        )
+
+        codes = allocator.allocate(4)
+
+        self.assertNotIn(legacy, codes)
+        self.assertEqual(len(set(codes)), 4)
+
+    @override_settings(TICKET_CODE_KEY="")
+    def test_allocation_requires_a_key(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ticket_codes.TicketCodeAllocator(block_size=3).allocate(1)
+        self.assertFalse(Sequence.objects.filter(name=ticket_codes.CODE_SEQUENCE, value__gt=0).exists())
+
+    def test_purchase_does_not_read_tickets(self):
+        user = make_user("player", balance=1000)
+        make_round()
+        client = APIClient()
+        client.force_authenticate(user)
+        ticket_codes.allocator.allocate(1)  # blocks are checked for legacy codes once, when reserved
+
+        with CaptureQueriesContext(connection) as captured:
+            response = client.post("/play/", {"numbers": [1, 2, 3, 4, 5, 6], "amount": 100}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        ticket_reads = [q["sql"] for q in captured if q["sql"].startswith("SELECT") and '"api_ticket"' in q["sql"]]
+        self.assertEqual(ticket_reads, [])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        settled_tickets.clear()
+        self.addCleanup(settled_tickets.clear)
+        invalidate_current_round()
+        self.addCleanup(invalidate_current_round)
+        self.user = make_user("player")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_finished_round_result_is_cacheable_and_revalidates(self):
+        round_obj = make_round(is_accepting=False, is_finished=True, draw=[1, 2, 3, 4, 5, 6])
+        response = self.client.get(f"/rounds/{round_obj.id}/result/")
+
+        self.assertEqual(response.data["draw"], [1, 2, 3, 4, 5, 6])
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn(f"max-age={FINAL_MAX_AGE}", response["Cache-Control"])
+        self.assertIn("Expires", response)
+
+        again = self.client.get(f"/rounds/{round_obj.id}/result/", headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+        self.assertEqual(again["ETag"], response["ETag"])
+
+    def test_ticket_etag_changes_when_it_is_settled(self):
+        round_obj = make_round()
+        ticket = make_ticket(self.user, round_obj, [1, 2, 3, 4, 5, 6])
+        url = f"/tickets/{ticket.ticket_code}/"
+        open_response = self.client.get(url)
+        self.assertIn("private", open_response["Cache-Control"])
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": open_response["ETag"]}).status_code, 304)
+
+        Round.objects.filter(pk=round_obj.pk).update(is_accepting=False, is_finished=True, draw=[1, 2, 3, 4, 5, 6])
+        Ticket.objects.filter(pk=ticket.pk).update(winning=True, win_amount=500)
+        settled = self.client.get(url, headers={"If-None-Match": open_response["ETag"]})
+        self.assertEqual(settled.status_code, 200)
+        self.assertTrue(settled.data["winning"])
+        # Served from settled_tickets now, under the same ETag
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": settled["ETag"]}).status_code, 304)
+
+    def test_status_etag_only_changes_with_the_round_state(self):
+        round_obj = make_round()
+        now = timezone.now()
+        response = self.client.get("/rounds/current/")
+        self.assertIn("max-age=0", response["Cache-Control"])
+
+        # Seconds later time_left_seconds has moved, but the round has not
+        with mock.patch("django.utils.timezone.now", return_value=now + timedelta(seconds=5)):
+            again = self.client.get("/rounds/current/", headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(again.status_code, 304)
+
+        Round.objects.filter(pk=round_obj.pk).add_tickets(1, 100)
+        invalidate_current_round()
+        changed = self.client.get("/rounds/current/", headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["tickets_count"], 1)
+
+
+class RoundCounterTests(TestCase):
+    def setUp(self):
+        self.user = make_user("player", balance=10_000)
+        self.round = make_round()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertCounters(self, count, stake):
+        self.round.refresh_from_db()
+        self.assertEqual((self.round.tickets_count, self.round.total_stake), (count, Decimal(stake)))
+
+    def test_every_creation_path_counts(self):
+        self.client.post("/play/", {"numbers": [1, 2, 3, 4, 5, 6], "amount": 100}, format="json")
+        self.assertCounters(1, 100)
+
+        tickets = [{"numbers": [1, 2, 3, 4, 5, n], "amount": 50} for n in (7, 8, 9)]
+        self.client.post("/play/batch/", {"tickets": tickets}, format="json")
+        self.assertCounters(4, 250)
+
+        make_ticket(self.user, self.round, [1, 2, 3, 4, 5, 6], amount=25)
+        self.assertCounters(5, 275)
+        self.assertEqual(self.client.get("/rounds/current/").json()["tickets_count"], 5)
+
+    def test_repair_recounts_live_and_archived_tickets(self):
+        make_ticket(self.user, self.round, [1, 2, 3, 4, 5, 6], amount=100)
+        make_ticket(self.user, self.round, [1, 2, 3, 4, 5, 7], amount=40)
+        ticket = Ticket.objects.filter(round=self.round).first()
+        ArchivedTicket.objects.create(**{f: getattr(ticket, f) for f in archive.ARCHIVED_FIELDS})
+        Ticket.objects.filter(pk=ticket.pk).delete()
+        Round.objects.filter(pk=self.round.pk).update(tickets_count=0, total_stake=0)
+
+        out = StringIO()
+        call_command("repair_round_counters", stdout=out)
+        self.assertIn("of 1 rounds", out.getvalue())
+        self.assertCounters(2, 140)
+
+        call_command("repair_round_counters", stdout=out)
+        self.assertIn("of 0 rounds", out.getvalue())
+
+
+class TicketLookupTests(TestCase):
+    def setUp(self):
+        self.user = make_user("player")
+        self.round = make_round()
+        self.ticket = make_ticket(self.user, self.round, [1, 2, 3, 4, 5, 6], amount=250)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_detail_matches_the_serializer_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/tickets/{self.ticket.ticket_code}/")
+
+        self.assertEqual(response.status_code, 200)
+        expected = json.loads(JSONRenderer().render(TicketSerializer(self.ticket).data))
+        self.assertEqual(response.json(), expected)
+
+    def test_owner_lookup(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/play/{self.ticket.ticket_code}/")
+
+        self.assertEqual(response.data["round_id"], self.round.id)
+        self.assertEqual(response.data["numbers"], [1, 2, 3, 4, 5, 6])
+
+        self.client.force_authenticate(make_user("other"))
+        self.assertEqual(self.client.get(f"/play/{self.ticket.ticket_code}/").status_code, 404)
+
+
+class SettledTicketCacheTests(TestCase):
+    def setUp(self):
+        settled_tickets.clear()
+        self.addCleanup(settled_tickets.clear)
+        self.user = make_user("player")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_settled_tickets_are_served_from_memory(self):
+        round_obj = make_round(is_accepting=False, is_finished=True, draw=[1, 2, 3, 4, 5, 6])
+        ticket = make_ticket(self.user, round_obj, [1, 2, 3, 4, 5, 6])
+        first = self.client.get(f"/tickets/{ticket.ticket_code}/")
+        with self.assertNumQueries(0):
+            second = self.client.get(f"/tickets/{ticket.ticket_code}/")
+
+        self.assertEqual(second.json(), first.json())
+        stats = settled_tickets.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_open_rounds_bypass_the_cache(self):
+        ticket = make_ticket(self.user, make_round(), [1, 2, 3, 4, 5, 6])
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.client.get(f"/tickets/{ticket.ticket_code}/")
+        self.assertEqual(settled_tickets.stats()["entries"], 0)
+
+    @override_settings(TICKET_CACHE_SIZE=2)
+    def test_least_recently_used_is_evicted(self):
+        for code in ("A", "B"):
+            settled_tickets.put(code, {"ticket_code": code})
+        settled_tickets.get("A")
+        settled_tickets.put("C", {"ticket_code": "C"})
+
+        self.assertEqual(list(settled_tickets.entries), ["A", "C"])
+        self.assertEqual(settled_tickets.stats()["evictions"], 1)
+
+
+class TicketHistoryTests(TestCase):
+    def setUp(self):
+        self.user = make_user("player")
+        self.round = make_round()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Five tickets sharing one timestamp, so pages must break ties on id
+        same_time = timezone.now()
+        self.tickets = [make_ticket(self.user, self.round, [1, 2, 3, 4, 5, n]) for n in range(6, 11)]
+        Ticket.objects.filter(pk__in=[t.pk for t in self.tickets]).update(created_at=same_time)
+        Ticket.objects.filter(pk=self.tickets[0].pk).update(winning=True)
+        make_ticket(make_user("other"), self.round, [1, 2, 3, 4, 5, 6])
+
+    def test_pages_walk_every_ticket_once(self):
+        codes, cursor, queries = [], "", []
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get("/tickets/", {"limit": 2, "cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+            queries.append(len(ctx))
+            codes += [row["ticket_code"] for row in response.data["results"]]
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(codes, [t.ticket_code for t in reversed(self.tickets)])
+        # Full pages come from Ticket alone; only the last one also checks the archive
+        self.assertEqual(queries, [1, 1, 2])
+
+    def test_filters_and_bad_input(self):
+        response = self.client.get("/tickets/", {"winning": "true", "round": self.round.id})
+        self.assertEqual([row["ticket_code"] for row in response.data["results"]], [self.tickets[0].ticket_code])
+        self.assertEqual(self.client.get("/tickets/", {"round": make_round().id}).data["results"], [])
+
+        self.assertEqual(self.client.get("/tickets/", {"cursor": "not-a-cursor"}).status_code, 400)
+        self.assertEqual(self.client.get("/tickets/", {"winning": "maybe"}).status_code, 400)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        settled_tickets.clear()
+        self.addCleanup(settled_tickets.clear)
+        self.user = make_user("player")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        old_round = make_round(
+            accept_until=timezone.now() - timedelta(days=40), is_accepting=False, is_finished=True, draw=[1, 2, 3, 4, 5, 6],
+        )
+        self.old = [make_ticket(self.user, old_round, [1, 2, 3, 4, 5, n]) for n in range(6, 11)]
+        self.recent = make_ticket(self.user, make_round(), [1, 2, 3, 4, 5, 6])
+
+    def test_archives_old_rounds_in_chunks(self):
+        call_command("archive_tickets", days=30, chunk_size=2, stdout=StringIO())
+        call_command("archive_tickets", days=30, stdout=StringIO())  # nothing left to do
+
+        self.assertEqual(list(Ticket.objects.values_list("id", flat=True)), [self.recent.id])
+        archived = ArchivedTicket.objects.order_by("id")
+        self.assertEqual([t.ticket_code for t in archived], [t.ticket_code for t in self.old])
+        self.assertEqual(archived[0].created_at, self.old[0].created_at)
+
+    def test_reads_fall_back_to_the_archive(self):
+        call_command("archive_tickets", days=30, stdout=StringIO())
+        code = self.old[0].ticket_code
+
+        self.assertEqual(self.client.get(f"/tickets/{code}/").data["numbers"], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.client.get(f"/play/{code}/").data["ticket_code"], code)
+        history = self.client.get("/tickets/", {"limit": 50}).data["results"]
+        self.assertEqual(
+            [row["ticket_code"] for row in history],
+            [self.recent.ticket_code] + [t.ticket_code for t in reversed(self.old)],
+        )
+
+
+class TicketStagingTests(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, ignore_errors=True)
+        staging = override_settings(
+            TICKET_STAGING_SECONDS=3600, TICKET_STAGING_PATH=os.path.join(tmpdir, "staging.sqlite3"),
+        )
+        staging.enable()
+        self.addCleanup(staging.disable)
+
+        self.user = make_user("player", balance=1000)
+        self.round = make_round()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def play(self, numbers, amount=100):
+        return self.client.post("/play/", {"numbers": numbers, "amount": amount}, format="json")
+
+    def test_staged_play_reaches_tickets_on_flush(self):
+        response = self.play([1, 2, 3, 4, 5, 6])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(self.round.tickets.exists())
+        self.assertEqual(ticket_staging.pending_count(self.round.id), 1)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 900)
+
+        self.assertEqual(ticket_staging.flush_staged_tickets(), (1, 0))
+
+        ticket = self.round.tickets.get()
+        self.assertEqual(ticket.ticket_code, response.data["ticket_code"])
+        self.assertEqual(ticket.created_at, response.data["created_at"])
+        self.assertEqual(ticket.round_seq, 1)
+        self.assertEqual(self.round.played_numbers(), {1, 2, 3, 4, 5, 6})
+        self.assertEqual(RoundExposure.objects.get(round=self.round, combo="1-2-3").stake, 100)
+        self.assertEqual(ticket_staging.pending_count(), 0)
+        self.round.refresh_from_db()
+        self.assertEqual((self.round.tickets_count, self.round.total_stake), (1, 100))
+
+    def test_plays_left_over_after_the_draw_are_refunded_once(self):
+        self.play([1, 2, 3, 4, 5, 6])
+        Round.objects.filter(pk=self.round.pk).update(draw=[1, 2, 3, 4, 5, 6], is_accepting=False)
+
+        self.assertEqual(ticket_staging.flush_staged_tickets(), (0, 1))
+        # A re-run after a crash before the buffer was cleared must not refund twice
+        ticket_staging.refund_tickets([Ticket(round_id=self.round.id, round_seq=1, user=self.user, amount=100)])
+
+        self.assertFalse(self.round.tickets.exists())
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 1000)
+        self.assertEqual(Transaction.objects.filter(user=self.user, method="REFUND").count(), 1)
+
+    def test_play_paid_for_in_time_is_kept(self):
+        # Paid for a second before the close, written to the buffer after it
+        Round.objects.filter(pk=self.round.pk).update(accept_until=timezone.now() - timedelta(seconds=1))
+        self.round.refresh_from_db()
+        paid_at = self.round.accept_until - timedelta(seconds=1)
+        with mock.patch("api.purchases.timezone.now", return_value=paid_at):
+            self.play([1, 2, 3, 4, 5, 6])
+
+        self.assertEqual(ticket_staging.flush_staged_tickets(), (1, 0))
+        self.assertEqual(self.round.tickets.get().created_at, paid_at)
+
+
+class CurrentRoundCacheTests(TestCase):
+    def setUp(self):
+        self.round = make_round()
+        self.client = APIClient()
+
+    def test_polling_serves_the_published_snapshot(self):
+        now = timezone.now()
+        snapshot = publish_status_snapshot(now)
+
+        # Still the same snapshot seconds later: only time_left_seconds moves
+        for seconds in (0, 5):
+            with mock.patch("django.utils.timezone.now", return_value=now + timedelta(seconds=seconds)):
+                with self.assertNumQueries(0):
+                    response = self.client.get("/rounds/current/")
+            self.assertEqual(response.json()["id"], self.round.id)
+            self.assertEqual(response.json()["time_left_seconds"], round_status.time_left(snapshot, now) - seconds)
+
+    def test_only_one_request_rebuilds_a_stale_snapshot(self):
+        stale = publish_status_snapshot(timezone.now() - timedelta(seconds=round_status.STATUS_TICKETS_COUNT_SECONDS + 5))
+        cache.add(round_status.REBUILD_LOCK_KEY, 1)  # another worker is rebuilding
+        self.addCleanup(cache.delete, round_status.REBUILD_LOCK_KEY)
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/rounds/current/")
+        self.assertTrue(response.content.startswith(stale["body"][:-1]))
+
+        cache.delete(round_status.REBUILD_LOCK_KEY)
+        self.client.get("/rounds/current/")
+        self.assertGreater(cache.get(STATUS_SNAPSHOT_KEY)["valid_until"], timezone.now())
+
+    def test_cold_cache_builds_inline_while_another_worker_rebuilds(self):
+        invalidate_current_round()
+        cache.add(round_status.REBUILD_LOCK_KEY, 1)
+        self.addCleanup(cache.delete, round_status.REBUILD_LOCK_KEY)
+
+        with mock.patch("time.sleep") as sleep:
+            response = self.client.get("/rounds/current/")
+
+        self.assertEqual(response.json()["id"], self.round.id)
+        sleep.assert_not_called()
+        self.assertIsNone(cache.get(STATUS_SNAPSHOT_KEY))  # left for the lock holder to publish
+
+    def test_scheduler_close_is_seen_immediately(self):
+        self.assertEqual(self.client.get("/rounds/current/").status_code, 200)
+
+        Round.objects.filter(pk=self.round.pk).update(is_accepting=False, accept_until=timezone.now())
+        self.assertEqual(self.client.get("/rounds/current/").status_code, 200)  # still cached
+        invalidate_current_round()
+
+        self.assertEqual(self.client.get("/rounds/current/").status_code, 404)
+
+    def test_stale_descriptor_cannot_sell_into_a_closed_round(self):
+        user = make_user("player", balance=1000)
+        self.client.force_authenticate(user)
+        self.client.get("/rounds/current/")
+        Round.objects.filter(pk=self.round.pk).update(is_accepting=False)
+
+        response = self.client.post("/play/", {"numbers": [1, 2, 3, 4, 5, 6], "amount": 100}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.round.tickets.exists())
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.balance, 1000)
+
+
+class BatchPlayTests(TestCase):
+    def setUp(self):
+        self.user = make_user("player", balance=10000)
+        self.round = make_round()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def play_batch(self, *plays):
+        tickets = [{"numbers": numbers, "amount": amount} for numbers, amount in plays]
+        return self.client.post("/play/batch/", {"tickets": tickets}, format="json")
+
+    def test_batch_is_bought_in_one_go(self):
+        response = self.play_batch(([1, 2, 3, 4, 5, 6], 100), ([1, 2, 3, 7, 8, 90], 50), ([6, 5, 4, 3, 2, 1], 100))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["total_amount"], 250)
+        self.assertEqual(len({t["ticket_code"] for t in response.data["tickets"]}), 3)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 9750)
+        self.assertEqual(sorted(self.round.tickets.values_list("round_seq", flat=True)), [1, 2, 3])
+        self.assertEqual(self.round.played_numbers(), {1, 2, 3, 4, 5, 6, 7, 8, 90})
+
+        exposures = dict(RoundExposure.objects.filter(round=self.round).values_list("combo", "tickets"))
+        self.assertEqual(exposures["1-2-3"], 3)
+        self.assertEqual(RoundExposure.objects.get(round=self.round, combo="4-5-6").stake, 200)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def queries(count):
+            plays = [([1, 2, 3, 4, 5, 6], 10)] * count
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.play_batch(*plays).status_code, 201)
+            return len(captured)
+
+        queries(1)  # warms the current-round cache
+        self.assertEqual(queries(2), queries(20))
+
+    def test_invalid_ticket_rejects_the_whole_batch(self):
+        response = self.play_batch(([1, 2, 3, 4, 5, 6], 100), ([1, 1, 2, 3, 4, 5], 100))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.round.tickets.exists())
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 10000)
+
+
+class RoundCalendarTests(TestCase):
+    def tick(self):
+        call_command("manage_rounds", stdout=StringIO())
+
+    def test_first_tick_opens_a_round_and_schedules_ahead(self):
+        self.tick()
+
+        active = Round.objects.get(is_accepting=True)
+        scheduled = list(Round.objects.scheduled().order_by("opens_at"))
+        break_length = timedelta(seconds=lottery_settings.get_lottery_settings().break_duration_seconds)
+        self.assertEqual(len(scheduled), UPCOMING_ROUNDS)
+        self.assertEqual(scheduled[0].opens_at, active.accept_until + break_length)
+        self.assertEqual(scheduled[1].opens_at, scheduled[0].accept_until + break_length)
+
+    def test_due_round_is_opened_and_missed_ones_dropped(self):
+        now = timezone.now()
+        missed = make_round(is_accepting=False, opens_at=now - timedelta(minutes=5), accept_until=now - timedelta(minutes=2))
+        due = make_round(is_accepting=False, opens_at=now - timedelta(seconds=1))
+
+        self.tick()
+
+        due.refresh_from_db()
+        self.assertTrue(due.is_accepting)
+        self.assertFalse(Round.objects.filter(pk=missed.pk).exists())
+        self.assertEqual(Round.objects.scheduled().count(), UPCOMING_ROUNDS)
+
+    def test_clients_are_told_when_the_next_round_opens(self):
+        opens_at = timezone.now() + timedelta(seconds=20)
+        make_round(is_accepting=False, opens_at=opens_at, accept_until=opens_at + timedelta(minutes=3))
+
+        response = APIClient().get("/rounds/current/")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(parse_datetime(response.json()["next_round_opens_at"]), opens_at)
+        self.assertIn(response["Retry-After"], ("19", "20"))
+
+
+class RunRoundsTests(TestCase):
+    def setUp(self):
+        self.command = RunRoundsCommand(stdout=StringIO(), stderr=StringIO())
+        self.addCleanup(invalidate_current_round)
+
+    def test_next_deadline_follows_the_calendar(self):
+        now = timezone.now()
+        with mock.patch("django.utils.timezone.now", return_value=now):
+            self.assertEqual(self.command.next_deadline(), now)  # empty calendar: tick right away
+
+        upcoming = make_round(is_accepting=False, opens_at=now + timedelta(seconds=30))
+        self.assertEqual(self.command.next_deadline(), upcoming.opens_at)
+
+        active = make_round()
+        self.assertEqual(self.command.next_deadline(), active.accept_until)
+
+    def test_sleep_is_capped_by_max_sleep(self):
+        make_round(is_accepting=False, opens_at=timezone.now() + timedelta(hours=1))
+
+        # Interrupt the loop at its first sleep
+        with mock.patch("api.management.commands.run_rounds.time.sleep", side_effect=KeyboardInterrupt) as sleep:
+            call_command("run_rounds", max_sleep=5, stdout=StringIO())
+
+        sleep.assert_called_once_with(5)
+
+    def test_tick_ends_the_round_at_its_deadline(self):
+        round_obj = make_round()
+        deadline = round_obj.accept_until
+
+        with mock.patch("django.utils.timezone.now", return_value=deadline + timedelta(milliseconds=20)):
+            self.command.tick(deadline)
+
+        round_obj.refresh_from_db()
+        self.assertTrue(round_obj.is_finished)
+        self.assertIsNotNone(round_obj.draw)
+        self.assertIn("20.0 ms after deadline", self.command.stdout.getvalue())
+
+
+class LotterySettingsTests(TestCase):
+    def setUp(self):
+        # Snapshots outlive the rows a TestCase rolls back
+        lottery_settings.invalidate()
+        self.addCleanup(lottery_settings.invalidate)
+
+    def test_reads_are_served_from_the_snapshot(self):
+        lottery_settings.get_lottery_settings()
+        with self.assertNumQueries(0):
+            config = lottery_settings.get_lottery_settings()
+        self.assertEqual(config, lottery_settings.DEFAULTS)
+
+    def test_saving_a_row_invalidates_every_snapshot(self):
+        lottery_settings.get_lottery_settings()
+        version = cache.get(lottery_settings.VERSION_CACHE_KEY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LotterySettings.objects.create(key="win_multiplier_3", value=9)
+            LotterySettings.objects.create(key="break_duration_seconds", value=10)
+
+        self.assertNotEqual(cache.get(lottery_settings.VERSION_CACHE_KEY), version)
+        config = lottery_settings.get_lottery_settings()
+        self.assertEqual(config.win_multipliers[3], 9)
+        self.assertEqual(config.win_multipliers[6], 50)
+        self.assertEqual(config.break_duration_seconds, 10)
+
+    def test_cycle_counter_is_read_from_the_db(self):
+        self.assertEqual(lottery_settings.get_cycle_counter(), lottery_settings.CYCLE_DEFAULT)
+        lottery_settings.get_lottery_settings()
+        version = cache.get(lottery_settings.VERSION_CACHE_KEY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lottery_settings.set_value(CYCLE_KEY, 3)
+            lottery_settings.set_value(CYCLE_KEY, 4)
+        self.assertEqual(lottery_settings.get_cycle_counter(), 4)
+        # Advancing the cycle does not make every process reload its settings
+        self.assertEqual(cache.get(lottery_settings.VERSION_CACHE_KEY), version)
+
+        # Written by another process, behind this one's snapshot
+        LotterySettings.objects.filter(key=CYCLE_KEY).update(value=5)
+        self.assertEqual(lottery_settings.get_cycle_counter(), 5)
+
+
+class RoundEventsTests(TestCase):
+    def setUp(self):
+        invalidate_current_round()
+        self.addCleanup(invalidate_current_round)
+
+    def test_watcher_reports_open_close_and_draw(self):
+        hub = round_events.RoundEventHub()
+        self.assertEqual(hub.check(), [])  # primes on the current state
+
+        round_obj = make_round()
+        self.assertEqual([name for _, name, _ in hub.check()], ["round.opened"])
+
+        Round.objects.filter(pk=round_obj.pk).update(is_accepting=False)
+        invalidate_current_round()
+        self.assertEqual([name for _, name, _ in hub.check()], ["round.closed"])
+        self.assertEqual(hub.check(), [])
+
+        Round.objects.filter(pk=round_obj.pk).update(is_finished=True, draw=[1, 2, 3, 4, 5, 6])
+        [(event_id, name, data)] = hub.check()
+        self.assertEqual((name, data["draw"]), ("round.drawn", [1, 2, 3, 4, 5, 6]))
+        self.assertEqual(event_id, round_events.event_id(round_obj.id, round_events.DRAWN))
+
+    def test_draw_comes_before_the_next_round_in_one_tick(self):
+        hub = round_events.RoundEventHub()
+        first = make_round()
+        hub.check()
+
+        # Round closed, drawn and the next one opened between two checks (no break)
+        Round.objects.filter(pk=first.pk).update(is_accepting=False, is_finished=True, draw=[1, 2, 3, 4, 5, 6])
+        second = make_round()
+        invalidate_current_round()
+        events = hub.check()
+        self.assertEqual([name for _, name, _ in events], ["round.closed", "round.drawn", "round.opened"])
+        self.assertEqual([data["round_id"] for _, _, data in events], [first.id, first.id, second.id])
+
+    async def test_late_draw_is_streamed_and_replayed(self):
+        hub = round_events.RoundEventHub()
+        patcher = mock.patch.object(round_events, "hub", hub)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        opened = (round_events.event_id(2, round_events.OPENED), "round.opened", {"round_id": 2})
+        drawn = (round_events.event_id(1, round_events.DRAWN), "round.drawn", {"round_id": 1})
+
+        stream = round_events.event_stream(last_id=None)
+        await anext(stream)  # retry
+        await anext(stream)  # round.state
+        hub.publish([opened])
+        self.assertTrue((await anext(stream)).startswith(f"id: {opened[0]}\n"))
+        hub.publish([drawn])
+        self.assertTrue((await anext(stream)).startswith(f"id: {drawn[0]}\n"))
+        await stream.aclose()
+
+        # Reconnecting after the "opened" event still gets the lower-numbered draw
+        self.assertEqual(hub.since(opened[0]), [drawn])
+
+    async def test_reconnect_replays_missed_events(self):
+        hub = round_events.RoundEventHub()
+        patcher = mock.patch.object(round_events, "hub", hub)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        hub.publish([(5, "round.opened", {"round_id": 1}), (6, "round.closed", {"round_id": 1})])
+
+        stream = round_events.event_stream(last_id=5)
+        self.assertTrue((await anext(stream)).startswith("retry:"))
+        self.assertEqual(await anext(stream), 'id: 6\nevent: round.closed\ndata: {"round_id": 1}\n\n')
+        hub.publish([(7, "round.drawn", {"round_id": 1, "draw": [1, 2, 3, 4, 5, 6]})])
+        self.assertTrue((await anext(stream)).startswith("id: 7\nevent: round.drawn"))
+
+        await stream.aclose()  # what a client disconnect does
+        self.assertEqual(hub.subscribers, set())
+        self.assertIsNone(hub.watcher)
+
+    async def test_stream_requires_a_token(self):
+        self.assertEqual((await self.async_client.get("/rounds/events/")).status_code, 401)
+
+        user = await sync_to_async(make_user)("player")
+        access = str(RefreshToken.for_user(user).access_token)
+        # Access tokens would end up in access logs: only the header takes them
+        self.assertEqual((await self.async_client.get("/rounds/events/", {"token": access})).status_code, 401)
+        response = await self.async_client.get("/rounds/events/", headers={"Authorization": f"Bearer {access}"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        issued = await self.async_client.post(
+            "/rounds/events/token/", headers={"Authorization": f"Bearer {access}"},
+        )
+        token = issued.json()["token"]
+        response = await self.async_client.get("/rounds/events/", {"token": token})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        expired = time.time() + round_events.ROUND_EVENTS_TOKEN_SECONDS + 1
+        with mock.patch("django.core.signing.time.time", return_value=expired):
+            self.assertEqual((await self.async_client.get("/rounds/events/", {"token": token})).status_code, 401)
+
+
+class DrawOptimizerTests(TestCase):
+    def setUp(self):
+        self.user = make_user("player")
+        self.round = make_round()
+        # Cover every number of the 1..40 pool, plus some heavy overlap on 1-6
+        for first in range(1, 41, 6):
+            make_ticket(self.user, self.round, [(first + i - 1) % 40 + 1 for i in range(6)])
+        make_ticket(self.user, self.round, [1, 2, 3, 4, 5, 6], amount=1000)
+        self.tickets = Ticket.objects.filter(round=self.round)
+
+    def test_reported_payout_matches_settlement(self):
+        choice = choose_draw_by_exposure(self.tickets, WIN_MULTIPLIER_MAP)
+
+        winners = settle_tickets(self.tickets, choice.draw, WIN_MULTIPLIER_MAP)
+        self.assertEqual(choice.payout, sum(amount for _, _, amount in winners))
+        self.assertEqual(choice.payout, 0)
+
+    def test_scores_every_candidate_exactly(self):
+        coefficients = subset_coefficients(WIN_MULTIPLIER_MAP)
+        tables = build_exposure_tables(*load_ticket_matrix(self.tickets), coefficients)
+        draws = [[1, 2, 3, 4, 5, 6], [1, 2, 3, 20, 30, 40], [2, 3, 4, 5, 6, 7], [1, 2, 3, 4, 8, 9]]
+        payouts = score_draws(tables, coefficients, draws)
+
+        for draw, payout in zip(draws, payouts):
+            winners = settle_tickets(self.tickets, draw, WIN_MULTIPLIER_MAP)
+            self.assertEqual(Decimal(int(payout)) / 100, sum(amount for _, _, amount in winners))
+
+
+class RandomTicketTests(TestCase):
+    def test_skips_gaps_left_by_deleted_tickets(self):
+        user = make_user("player")
+        round_obj = make_round(ticket_seq=3)
+        kept = Ticket.objects.create(user=user, round=round_obj, round_seq=2, numbers=[1, 2, 3, 4, 5, 6], amount=1)
+
+        for _ in range(10):
+            self.assertEqual(round_obj.random_ticket(), kept)
+
+    def test_empty_round(self):
+        self.assertIsNone(make_round().random_ticket())
+
+
+class TicketMatchTests(TestCase):
+    def test_sql_match_count_uses_numbers_mask(self):
+        user = make_user("player")
+        round_obj = make_round()
+        ticket = make_ticket(user, round_obj, [1, 2, 45, 46, 89, 90])
+
+        self.assertEqual((ticket.numbers_mask_lo, ticket.numbers_mask_hi), numbers_to_mask(ticket.numbers))
+        matched = Ticket.objects.with_matches([2, 3, 45, 46, 90, 10]).get(pk=ticket.pk)
+        self.assertEqual(matched.matches, 4)
+        self.assertFalse(Ticket.objects.with_matches([3, 4, 5, 6, 7, 8]).filter(matches__gt=0).exists())
+
+
+class BitmaskTests(TestCase):
+    def test_round_trip(self):
+        numbers = [1, 17, 45, 46, 80, 90]
+        lo, hi = numbers_to_mask(numbers)
+        self.assertLess(max(lo, hi), 2 ** 63)
+        self.assertEqual(mask_to_numbers(lo, hi), numbers)
@@ -0,0 +1,86 @@
+# api/ticket_cache.py
+
+"""
+Cache of ticket lookups for settled rounds.
+
+Once a round is finished its tickets never change, so TicketDetailView
+keeps their responses in a per-process LRU of at most TICKET_CACHE_SIZE
+entries (least recently used evicted first). With
+TICKET_CACHE_SHARED_TIMEOUT set, entries also go to the shared Django
+cache, so a code checked on one worker is a hit on the others. Tickets of
+open rounds are never cached: their result is not final yet.
+
+Counters are per process and reset on restart.
+"""
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+SHARED_KEY = "tickets:settled:{}"
+
+
+class SettledTicketCache:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+    def get(self, ticket_code):
+        """The cached response for ticket_code, or None (counted as a miss)."""
+        with self.lock:
+            data = self.entries.get(ticket_code)
+            if data is not None:
+                self.entries.move_to_end(ticket_code)
+                self.hits += 1
+                return data
+
+        if settings.TICKET_CACHE_SHARED_TIMEOUT:
+            data = cache.get(SHARED_KEY.format(ticket_code))
+            if data is not None:
+                self.store_local(ticket_code, data)
+                with self.lock:
+                    self.shared_hits += 1
+                return data
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, ticket_code, data):
+        """Cache a settled ticket's response. Callers check the round is finished."""
+        self.store_local(ticket_code, data)
+        if settings.TICKET_CACHE_SHARED_TIMEOUT:
+            cache.set(SHARED_KEY.format(ticket_code), data, settings.TICKET_CACHE_SHARED_TIMEOUT)
+
+    def store_local(self, ticket_code, data):
+        with self.lock:
+            self.entries[ticket_code] = data
+            self.entries.move_to_end(ticket_code)
+            while len(self.entries) > settings.TICKET_CACHE_SIZE:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": settings.TICKET_CACHE_SIZE,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else None,
+            }
+
+    def clear(self):
+        """Drop this process's entries and counters (the shared tier expires on its own)."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+
+settled_tickets = SettledTicketCache()
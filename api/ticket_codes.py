@@ -0,0 +1,123 @@
+# api/ticket_codes.py
+
+"""
+Ticket codes that are unique by construction.
+
+Every ticket takes the next value of a global counter. The counter is
+reserved CODE_BLOCK_SIZE values at a time per process, so the insert path
+normally does not touch the DB at all. That value is pushed through a keyed
+Feistel permutation of [0, 36**8) and written as 8 characters of the usual
+alphabet. A permutation maps distinct inputs to distinct outputs, so codes
+never need checking against each other. Without knowing TICKET_CODE_KEY,
+consecutive tickets' codes look unrelated, so codes cannot be guessed from
+one another. The key is a dedicated secret, and allocating a code without
+it raises ImproperlyConfigured: anyone holding it could list every code in order.
+
+Tickets from before this scheme carry random codes that may land anywhere
+in the permutation's range. Each block is checked against the stored codes
+once when it is reserved (one indexed query per CODE_BLOCK_SIZE codes), and
+clashing codes are skipped.
+
+TICKET_CODE_KEY must never change once codes have been issued: a new key is
+a different permutation and could repeat an existing code.
+"""
+
+import hashlib
+import os
+import string
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 8
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH  # ~2**41.4
+HALF_BITS = 21                             # Feistel works on 42-bit numbers, cycle-walking back into CODE_SPACE
+HALF_MASK = (1 << HALF_BITS) - 1
+FEISTEL_ROUNDS = 6
+
+CODE_SEQUENCE = "ticket_code"
+CODE_BLOCK_SIZE = 1000
+
+
+def _round_key(key):
+    return hashlib.blake2b(key.encode(), digest_size=32, person=b"ticket-codes").digest()
+
+
+def permute(n, key):
+    """Image of n under the keyed permutation of [0, CODE_SPACE). `key` is raw bytes."""
+    if not 0 <= n < CODE_SPACE:
+        raise ValueError(f"Ticket number out of range: {n}")
+    while True:
+        left, right = n >> HALF_BITS, n & HALF_MASK
+        for i in range(FEISTEL_ROUNDS):
+            digest = hashlib.blake2b(bytes([i]) + right.to_bytes(3, "big"), key=key, digest_size=4).digest()
+            left, right = right, left ^ (int.from_bytes(digest, "big") & HALF_MASK)
+        n = (left << HALF_BITS) | right
+        # Walking the 42-bit permutation until it lands in range keeps it a permutation of CODE_SPACE
+        if n < CODE_SPACE:
+            return n
+
+
+def encode(n):
+    """n in [0, CODE_SPACE) as a fixed-width base-36 code."""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        n, digit = divmod(n, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+class TicketCodeAllocator:
+    """Hands out codes from per-process blocks of the CODE_SEQUENCE counter."""
+
+    def __init__(self, block_size=CODE_BLOCK_SIZE):
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.pid = None
+        self.codes = []
+
+    def allocate(self, count):
+        """
+        `count` fresh codes. Reserving a block commits the counter bump only
+        with the surrounding transaction, so call this outside of one where
+        possible (buy_tickets does): a rolled-back block would be handed out again.
+        """
+        codes = []
+        with self.lock:
+            if self.pid != os.getpid():
+                # A forked worker must not reuse its parent's block
+                self.pid, self.codes = os.getpid(), []
+            while len(codes) < count:
+                if not self.codes:
+                    self.codes = self.reserve_block()
+                take = min(count - len(codes), len(self.codes))
+                codes.extend(self.codes[:take])
+                del self.codes[:take]
+        return codes
+
+    def reserve_block(self):
+        """The next block's codes, minus any already held by a pre-permutation ticket."""
+        from .models import ArchivedTicket, Sequence, Ticket
+
+        if not settings.TICKET_CODE_KEY:
+            # Falling back to a committed value would let anyone list every ticket code
+            raise ImproperlyConfigured("Set the TICKET_CODE_KEY environment variable (a long random secret).")
+        key = _round_key(settings.TICKET_CODE_KEY)
+        end = Sequence.add_and_fetch(CODE_SEQUENCE, self.block_size)
+        codes = [encode(permute(n, key)) for n in range(end - self.block_size, end)]
+        taken = set(Ticket.objects.filter(ticket_code__in=codes).values_list("ticket_code", flat=True))
+        taken.update(ArchivedTicket.objects.filter(ticket_code__in=codes).values_list("ticket_code", flat=True))
+        return [code for code in codes if code not in taken]
+
+
+allocator = TicketCodeAllocator()
+
+
+def allocate_ticket_codes(count):
+    return allocator.allocate(count)
+
+
+def allocate_ticket_code():
+    return allocator.allocate(1)[0]
@@ -0,0 +1,205 @@
+# api/ticket_staging.py
+
+"""
+Write-behind buffer for plays placed in the last seconds of a round.
+
+Within TICKET_STAGING_SECONDS of accept_until, buy_tickets only debits the
+player and reserves round sequence numbers in the main DB. The tickets
+themselves are appended to a separate SQLite file in WAL mode, so a burst
+of plays is not bound by the main DB's per-row commit cost.
+flush_staged_tickets then moves them into Ticket in batches. The scheduler
+flushes a round before settling it, and `manage.py flush_tickets` can run
+alongside to keep the buffer short.
+
+Acceptance is decided by the time buy_tickets took the play, inside the
+transaction that debited it. Tickets accepted at or after accept_until, or
+still in the buffer once their round has been drawn, are refunded instead
+of created.
+
+The buffer is a file on the local disk, and the scheduler only flushes its
+own copy before the draw. Staging is therefore for single-host deployments,
+where the web workers and manage_rounds run on one machine and share
+TICKET_STAGING_PATH. Plays staged on any other host would miss settlement.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Round, RoundExposure, Ticket, Transaction
+from .settlement import apply_credits
+
+FLUSH_BATCH_SIZE = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS staged_ticket (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    round_id INTEGER NOT NULL,
+    round_seq INTEGER NOT NULL,
+    ticket_code TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    numbers TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    staged_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS staged_ticket_round ON staged_ticket (round_id, id);
+"""
+
+_local = threading.local()
+
+
+def staging_enabled():
+    return settings.TICKET_STAGING_SECONDS > 0
+
+
+def should_stage(round_obj, now):
+    """True if a play on round_obj at `now` goes through the buffer."""
+    return staging_enabled() and (round_obj.accept_until - now).total_seconds() <= settings.TICKET_STAGING_SECONDS
+
+
+def staging_connection():
+    """This thread's connection to the staging file (reopened after a fork)."""
+    path = settings.TICKET_STAGING_PATH
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid() or _local.path != path:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")  # staged plays are already paid for
+        conn.executescript(SCHEMA)
+        _local.conn, _local.pid, _local.path = conn, os.getpid(), path
+    return conn
+
+
+def stage_tickets(tickets, staged_at):
+    """
+    Append unsaved Ticket objects (round_seq and ticket_code set) to the
+    buffer, accepted at `staged_at`.
+    """
+    rows = [
+        (
+            ticket.round_id, ticket.round_seq, ticket.ticket_code, ticket.user_id,
+            json.dumps(ticket.numbers), str(ticket.amount), staged_at.isoformat(),
+        )
+        for ticket in tickets
+    ]
+    conn = staging_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO staged_ticket (round_id, round_seq, ticket_code, user_id, numbers, amount, staged_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+    for ticket in tickets:
+        ticket.created_at = staged_at
+
+
+def pending_count(round_id=None):
+    sql, params = "SELECT COUNT(*) FROM staged_ticket", []
+    if round_id is not None:
+        sql, params = sql + " WHERE round_id = ?", [round_id]
+    return staging_connection().execute(sql, params).fetchone()[0]
+
+
+def flush_staged_tickets(round_id=None, batch_size=FLUSH_BATCH_SIZE):
+    """
+    Move staged tickets (of one round, or all) into Ticket, refunding late ones.
+    Safe to re-run after a crash: rows already in Ticket, or already
+    refunded, are skipped. Returns (created, refunded).
+    """
+    conn = staging_connection()
+    created = refunded = 0
+    while True:
+        sql, params = "SELECT * FROM staged_ticket", []
+        if round_id is not None:
+            sql, params = sql + " WHERE round_id = ?", [round_id]
+        rows = conn.execute(sql + " ORDER BY id LIMIT ?", params + [batch_size]).fetchall()
+        if not rows:
+            return created, refunded
+
+        batch_created, batch_refunded = flush_rows(rows)
+        created += batch_created
+        refunded += batch_refunded
+        with conn:
+            conn.executemany("DELETE FROM staged_ticket WHERE id = ?", [(row[0],) for row in rows])
+
+
+def flush_rows(rows):
+    rounds = Round.objects.in_bulk({row[1] for row in rows})
+    keep, late = [], []
+    for row_id, round_id, round_seq, code, user_id, numbers, amount, staged_at in rows:
+        ticket = Ticket(
+            round_id=round_id,
+            round_seq=round_seq,
+            ticket_code=code,
+            user_id=user_id,
+            numbers=json.loads(numbers),
+            amount=Decimal(amount),
+            created_at=datetime.fromisoformat(staged_at),
+        )
+        round_obj = rounds.get(round_id)
+        if (
+            round_obj
+            and round_obj.draw is None
+            and not round_obj.is_finished
+            and ticket.created_at < round_obj.accept_until
+        ):
+            keep.append(ticket)
+        else:
+            late.append(ticket)
+
+    with transaction.atomic():
+        create_tickets(keep, rounds)
+        refund_tickets(late)
+    return len(keep), len(late)
+
+
+def create_tickets(tickets, rounds):
+    if not tickets:
+        return
+    existing = set(
+        Ticket.objects.filter(round_id__in={t.round_id for t in tickets}, round_seq__in={t.round_seq for t in tickets})
+        .values_list("round_id", "round_seq")
+    )
+    tickets = [t for t in tickets if (t.round_id, t.round_seq) not in existing]
+
+    staged_at = [t.created_at for t in tickets]
+    for ticket in tickets:
+        ticket.fill_numbers_mask()
+    Ticket.objects.bulk_create(tickets)
+    # auto_now_add stamped the flush time: keep the time the play was accepted
+    for ticket, created_at in zip(tickets, staged_at):
+        ticket.created_at = created_at
+    Ticket.objects.bulk_update(tickets, ["created_at"], batch_size=500)
+
+    by_round = defaultdict(list)
+    for ticket in tickets:
+        by_round[ticket.round_id].append(ticket)
+    for round_id, round_tickets in by_round.items():
+        round_obj = rounds[round_id]
+        round_obj.add_played_numbers({n for t in round_tickets for n in t.numbers})
+        Round.objects.filter(pk=round_id).add_tickets(len(round_tickets), sum(t.amount for t in round_tickets))
+        RoundExposure.record_many(round_obj, [(t.numbers, t.amount) for t in round_tickets])
+
+
+def refund_tickets(tickets):
+    if not tickets:
+        return
+    references = {f"REFUND-{t.round_id}-{t.round_seq}": t for t in tickets}
+    done = set(Transaction.objects.filter(reference__in=references).values_list("reference", flat=True))
+    pending = {ref: t for ref, t in references.items() if ref not in done}
+
+    totals = defaultdict(Decimal)
+    for ticket in pending.values():
+        totals[ticket.user_id] += ticket.amount
+    apply_credits(totals)
+    Transaction.objects.bulk_create([
+        Transaction(user_id=t.user_id, amount=t.amount, method="REFUND", status="COMPLETED", reference=ref)
+        for ref, t in pending.items()
+    ])
@@ -1,15 +1,21 @@
 from django.urls import path
 from .views import (
     PlayTicketView,
+    BatchPlayTicketView,
     CurrentRoundStatusView,
+    RoundResultView,
     ProfilePictureUploadView,
     TicketDetailView,
+    TicketHistoryView,
+    TicketCacheStatsView,
+    RoundExposureView,
     LoginUserView,
     RegisterUserView,
     VerifyEmailView,
 
 )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .round_events import RoundEventsTokenView, round_events
 from .flutterwave_deposits import DepositView, FlutterwaveWebhookView, FlutterwaveVerifyView
 
 
@@ -24,9 +30,17 @@ urlpatterns = [
     path("register/", RegisterUserView.as_view(), name="register"),
     path("verify-email/<str:token>/", VerifyEmailView.as_view(), name="verify_email"),
     path("play/", PlayTicketView.as_view(), name="play"),
+    path("play/batch/", BatchPlayTicketView.as_view(), name="play_batch"),
+    path("play/<str:ticket_code>/", PlayTicketView.as_view(), name="play_ticket"),
     path("rounds/current/", CurrentRoundStatusView.as_view(), name="current_round"),
+    path("rounds/events/", round_events, name="round_events"),
+    path("rounds/events/token/", RoundEventsTokenView.as_view(), name="round_events_token"),
+    path("rounds/<int:round_id>/result/", RoundResultView.as_view(), name="round_result"),
+    path("rounds/<int:round_id>/exposure/", RoundExposureView.as_view(), name="round_exposure"),
     path("profile/picture/", ProfilePictureUploadView.as_view(), name="profile_picture"),
-    path("tickets/<uuid:ticket_uuid>/", TicketDetailView.as_view(), name="ticket_detail"),
+    path("tickets/", TicketHistoryView.as_view(), name="ticket_history"),
+    path("tickets/cache/stats/", TicketCacheStatsView.as_view(), name="ticket_cache_stats"),
+    path("tickets/<str:ticket_code>/", TicketDetailView.as_view(), name="ticket_detail"),
     path('login/', LoginUserView.as_view(), name='login'),
  
 
@@ -97,75 +97,70 @@
 
 import random
 from django.db import transaction
-from django.db.models import F
-from .models import Round, Ticket
-
-# Updated multipliers
-WIN_MULTIPLIER_MAP = {
-    3: 5,   # 3 numbers match → ×5
-    4: 7,   # 4 numbers match → ×7
-    5: 15,  # 5 numbers match → ×15
-    6: 50   # 6 numbers match → ×50
-}
-
-TOTAL_LOSE_ROUNDS = 5
-PARTIAL_WIN_MATCH = 3  # First 3 numbers of the winner ticket will match
-
-def finalize_round(round_obj, rounds_played):
-    tickets = Ticket.objects.filter(round=round_obj).select_related('user__profile')
+from .models import RoundExposure, Ticket
+from .settlement import settle_tickets, credit_winners
+from .draw_optimizer import choose_draw_by_exposure
+from .lottery_settings import CYCLE_KEY, DEFAULTS, get_lottery_settings
 
-    # Collect all numbers played
-    all_numbers_played = set()
-    for ticket in tickets.values_list('numbers', flat=True):
-        all_numbers_played.update(ticket)
+# Defaults only: the live values come from get_lottery_settings() and can be
+# changed through LotterySettings without a deploy
+WIN_MULTIPLIER_MAP = DEFAULTS.win_multipliers
+TOTAL_LOSE_ROUNDS = DEFAULTS.total_lose_rounds
 
-    winner_ticket = None
+PARTIAL_WIN_MATCH = 3  # First 3 numbers of the winner ticket will match
 
-    if rounds_played < TOTAL_LOSE_ROUNDS:
-        # Losing rounds: pick 6 numbers not in any ticket
+def choose_draw(round_obj, rounds_played):
+    """Pick the draw for a round according to where we are in the lose/win cycle."""
+    config = get_lottery_settings()
+    if rounds_played < config.total_lose_rounds:
+        # Losing rounds: pick 6 numbers not in any ticket,
+        # using the coverage mask maintained at purchase time
+        all_numbers_played = round_obj.played_numbers()
         available_numbers = set(range(1, 41)) - all_numbers_played
         population = list(available_numbers)
-        draw = sorted(random.sample(population, 6)) if len(population) >= 6 else sorted(random.sample(range(1, 41), 6))
-    else:
-        # Winning round: pick one random ticket to win partially
-        winner_ticket = tickets.order_by('?').first()
-        draw = random.sample(range(1, 41), 6)
-        if winner_ticket:
-            # Ensure first PARTIAL_WIN_MATCH numbers match
-            draw[:PARTIAL_WIN_MATCH] = winner_ticket.numbers[:PARTIAL_WIN_MATCH]
-            draw = sorted(draw)
-
-    # Save draw and close round
-    round_obj.draw = list(draw)
-    round_obj.is_finished = True
-    round_obj.is_accepting = False
-    round_obj.save(update_fields=['draw', 'is_finished', 'is_accepting'])
-
-    # ---------------------------
-    # Update tickets and balances
-    # ---------------------------
+        if len(population) >= 6:
+            return sorted(random.sample(population, 6))
+        # Every number has been played: score candidate draws against the tickets instead
+        return choose_draw_by_exposure(Ticket.objects.filter(round=round_obj), config.win_multipliers).draw
+
+    # Winning round: pick one random ticket to win partially
+    winner_ticket = round_obj.random_ticket()
+    draw = random.sample(range(1, 41), 6)
     if winner_ticket:
-        matched_numbers = len(set(winner_ticket.numbers) & set(draw))
-        multiplier = WIN_MULTIPLIER_MAP.get(matched_numbers, 0)  # 0 if <3 matches
-
-        winner_ticket.winning = matched_numbers >= 3
-        winner_ticket.win_amount = winner_ticket.amount * multiplier if winner_ticket.winning else 0
-        winner_ticket.save(update_fields=['winning', 'win_amount'])
-
-        if winner_ticket.winning:
-            profile = winner_ticket.user.profile
-            with transaction.atomic():
-                profile.balance = F('balance') + winner_ticket.win_amount
-                profile.save(update_fields=['balance'])
+        # Ensure first PARTIAL_WIN_MATCH numbers match, without repeating any of them
+        picked = winner_ticket.numbers[:PARTIAL_WIN_MATCH]
+        rest = random.sample([n for n in range(1, 41) if n not in picked], 6 - len(picked))
+        draw = sorted(picked + rest)
+    return draw
 
-    # All other tickets lose
-    tickets.exclude(id=winner_ticket.id if winner_ticket else None).update(winning=False, win_amount=0)
 
-    # ---------------------------
-    # Update rounds_played counter
+def next_cycle(rounds_played):
     rounds_played += 1
-    if rounds_played > TOTAL_LOSE_ROUNDS:
+    if rounds_played > get_lottery_settings().total_lose_rounds:
         rounds_played = 1
-
     return rounds_played
 
+
+def finalize_round(round_obj, rounds_played):
+    tickets = Ticket.objects.filter(round=round_obj)
+    draw = choose_draw(round_obj, rounds_played)
+
+    # is_finished must not be visible before the results are: finished
+    # rounds' tickets are cached as final, see api/ticket_cache.py
+    with transaction.atomic():
+        # Save draw and close round
+        round_obj.draw = list(draw)
+        round_obj.is_finished = True
+        round_obj.is_accepting = False
+        round_obj.save(update_fields=['draw', 'is_finished', 'is_accepting'])
+
+        # ---------------------------
+        # Settle every ticket against the draw and credit winners
+        # ---------------------------
+        winners = settle_tickets(tickets, draw, get_lottery_settings().win_multipliers)
+        credit_winners(round_obj, winners)
+        RoundExposure.purge(round_obj.id)
+
+    # ---------------------------
+    # Update rounds_played counter
+    return next_cycle(rounds_played)
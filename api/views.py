@@ -1,4 +1,6 @@
-from datetime import timedelta
+import base64
+from datetime import datetime, timedelta
+import math
 import uuid
 from decimal import Decimal
 import requests
@@ -7,6 +9,8 @@ from .serializers import ProfileSerializer
 from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate
 from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -20,19 +24,37 @@ from rest_framework_simplejwt.tokens import RefreshToken
 
 from api.models import Profile
 from api.serializers import UserRegistrationSerializer
-from .models import User, Profile, Round, Ticket, BankWithdrawal, Transaction
+from .models import User, Profile, Round, Ticket, ArchivedTicket, BankWithdrawal, Transaction, RoundExposure, EXPOSURE_COMBO_SIZE
 from .serializers import (
     PlayRequestSerializer,
-    TicketSerializer,
+    BatchPlayRequestSerializer,
     RoundStatusSerializer,
     UserRegistrationSerializer,
     UserLoginSerializer,
     ProfileSerializer
 )
+from .lottery_settings import get_lottery_settings
+from .current_round import current_round_state, get_current_round, invalidate_current_round
+from .purchases import InsufficientBalance, RoundClosed, buy_tickets
+from .ticket_cache import settled_tickets
+from .conditional import FINAL_MAX_AGE, ConditionalGetMixin
+from .round_status import render_status, status_snapshot
 
 User = get_user_model()
 
 
+def no_active_round_response(detail, status_code, now):
+    """Between rounds: tell the client when the next pre-allocated round opens."""
+    next_opens_at = current_round_state(now)["next_opens_at"]
+    response = Response(
+        {"detail": detail, "next_round_opens_at": next_opens_at},
+        status=status_code
+    )
+    if next_opens_at:
+        response["Retry-After"] = str(max(math.ceil((next_opens_at - now).total_seconds()), 1))
+    return response
+
+
 
 
 # =======================================
@@ -198,37 +220,22 @@ class PlayTicketView(APIView):
                 status=400
             )
 
-        user_profile = request.user.profile
-
-        if user_profile.balance < amount:
-            return Response(
-                {"detail": "Insufficient balance."},
-                status=400
-            )
-
         now = timezone.now()
-        current_round = Round.objects.filter(
-            is_accepting=True,
-            is_finished=False,
-            accept_until__gt=now
-        ).first()
+        current_round = get_current_round(now)
 
         if not current_round:
+            return no_active_round_response("No active round accepting plays at this time.", 400, now)
+
+        try:
+            ticket, = buy_tickets(request.user, current_round, [(numbers, amount)])
+        except InsufficientBalance:
             return Response(
-                {"detail": "No active round accepting plays at this time."},
+                {"detail": "Insufficient balance."},
                 status=400
             )
-
-        with transaction.atomic():
-            user_profile.balance -= amount
-            user_profile.save()
-
-            ticket = Ticket.objects.create(
-                round=current_round,
-                user=request.user,
-                numbers=sorted(numbers),
-                amount=amount
-            )
+        except RoundClosed:
+            invalidate_current_round()
+            return no_active_round_response("No active round accepting plays at this time.", 400, now)
 
         return Response(
             {
@@ -245,23 +252,76 @@ class PlayTicketView(APIView):
         """
         Retrieve ticket details by ticket_code for printing
         """
-        try:
-            ticket = Ticket.objects.get(ticket_code=ticket_code, user=request.user)
-        except Ticket.DoesNotExist:
+        # One values() query, no model instances; archived tickets only cost a second one
+        fields = ("ticket_code", "round_id", "numbers", "amount", "created_at")
+        ticket = Ticket.objects.filter(ticket_code=ticket_code, user=request.user).values(*fields).first()
+        if ticket is None:
+            ticket = ArchivedTicket.objects.filter(ticket_code=ticket_code, user=request.user).values(*fields).first()
+        if ticket is None:
             return Response(
                 {"detail": "Ticket not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        return Response(ticket, status=200)
+
+
+
+
+
+class BatchPlayTicketView(APIView):
+    """
+    Buy several tickets in one request: {"tickets": [{"numbers": [...], "amount": N}, ...]}.
+    Either every ticket is bought or none is.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BatchPlayRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        plays = []
+        for index, play in enumerate(serializer.validated_data["tickets"]):
+            numbers = list(set(play["numbers"]))
+            if len(numbers) != 6:
+                return Response(
+                    {"detail": f"Ticket {index + 1}: Numbers must be 6 unique values."},
+                    status=400
+                )
+            plays.append((numbers, play["amount"]))
+
+        now = timezone.now()
+        current_round = get_current_round(now)
+
+        if not current_round:
+            return no_active_round_response("No active round accepting plays at this time.", 400, now)
+
+        try:
+            tickets = buy_tickets(request.user, current_round, plays)
+        except InsufficientBalance:
+            return Response(
+                {"detail": "Insufficient balance."},
+                status=400
+            )
+        except RoundClosed:
+            invalidate_current_round()
+            return no_active_round_response("No active round accepting plays at this time.", 400, now)
+
         return Response(
             {
-                "ticket_code": ticket.ticket_code,
-                "round_id": ticket.round.id,
-                "numbers": ticket.numbers,
-                "amount": ticket.amount,
-                "created_at": ticket.created_at
+                "round_id": current_round.id,
+                "total_amount": sum(ticket.amount for ticket in tickets),
+                "tickets": [
+                    {
+                        "ticket_code": ticket.ticket_code,
+                        "numbers": ticket.numbers,
+                        "amount": ticket.amount,
+                        "created_at": ticket.created_at
+                    }
+                    for ticket in tickets
+                ],
             },
-            status=200
+            status=201
         )
 
 
@@ -275,39 +335,102 @@ class PlayTicketView(APIView):
 
 
 
-class CurrentRoundStatusView(APIView):
+class CurrentRoundStatusView(ConditionalGetMixin, APIView):
     permission_classes = [AllowAny] 
     """
     Returns the current active round's status.
     If no round is active, returns a 404.
+    The body is the snapshot the scheduler pre-renders, see api/round_status.py.
+    Its ETag does not cover time_left_seconds, so after a 304 clients count
+    down from accept_until.
     """
+    def perform_authentication(self, request):
+        # Public and identical for everyone: don't decode tokens nobody reads
+        pass
+
     def get(self, request):
         now = timezone.now()
-        current_round = Round.objects.filter(
-            is_accepting=True,
-            is_finished=False,
-            accept_until__gt=now
-        ).order_by('-id').first()
+        snapshot = status_snapshot(now)
+        response = HttpResponse(render_status(snapshot, now), status=snapshot["status"], content_type="application/json")
 
-        if not current_round:
-            return Response({"detail": "No active round"}, status=404)
+        if snapshot["status"] != 200:
+            if snapshot["retry_at"]:
+                response["Retry-After"] = str(max(math.ceil((snapshot["retry_at"] - now).total_seconds()), 1))
+            return response
+
+        # Revalidated on every poll: a reused body would carry an old time_left_seconds
+        return self.not_modified_etag(request, snapshot["etag"], 0) or response
+
+
+class RoundResultView(ConditionalGetMixin, APIView):
+    """
+    A round's draw. A finished round never changes, and an open one not
+    before accept_until, so clients and CDNs reuse the answer until then.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, round_id):
+        data = Round.objects.filter(pk=round_id).values("id", "accept_until", "is_finished", "draw").first()
+        if data is None:
+            return Response({"detail": "Round not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if data["is_finished"]:
+            fresh_for = FINAL_MAX_AGE
+        elif data["accept_until"]:
+            fresh_for = (data["accept_until"] - timezone.now()).total_seconds()
+        else:
+            fresh_for = 0
 
-        accept_until = current_round.accept_until
-        if timezone.is_naive(accept_until):
-            accept_until = timezone.make_aware(accept_until, timezone.utc)
+        version = (round_id, data["is_finished"], data["draw"])
+        return self.not_modified(request, version, fresh_for) or Response(data)
 
-        time_left = max(int((accept_until - now).total_seconds()), 0)
 
-        data = {
-            "id": current_round.id,
-            "is_accepting": current_round.is_accepting,
-            "is_finished": current_round.is_finished,
-            "accept_until": accept_until,
-            "draw": current_round.draw or [],
-            "time_left_seconds": time_left,
-            "tickets_count": current_round.tickets.count()
-        }
-        return Response(data)
+# =======================================
+# ROUND EXPOSURE VIEW (operators)
+# =======================================
+
+class RoundExposureView(APIView):
+    """
+    Stake per number and the riskiest combinations of an open round, read from
+    the RoundExposure counters maintained at purchase time.
+    `min_payout_if_drawn` is what the house owes at least if that
+    combination is part of the draw.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request, round_id):
+        try:
+            limit = min(int(request.query_params.get("limit", 20)), 500)
+        except ValueError:
+            return Response({"detail": "Invalid limit"}, status=400)
+        if limit < 1:
+            return Response({"detail": "Invalid limit"}, status=400)
+
+        exposures = RoundExposure.objects.filter(round_id=round_id)
+        numbers = exposures.filter(size=1).values_list("combo", "stake", "tickets")
+        combos = (
+            exposures.filter(size=EXPOSURE_COMBO_SIZE)
+            .order_by("-stake", "combo")
+            .values_list("combo", "stake", "tickets")[:limit]
+        )
+        multiplier = get_lottery_settings().win_multipliers[EXPOSURE_COMBO_SIZE]
+
+        return Response({
+            "round_id": round_id,
+            "numbers": sorted(
+                ({"number": int(combo), "stake": stake, "tickets": tickets} for combo, stake, tickets in numbers),
+                key=lambda row: row["number"],
+            ),
+            "top_combos": [
+                {
+                    "numbers": [int(n) for n in combo.split("-")],
+                    "stake": stake,
+                    "tickets": tickets,
+                    "min_payout_if_drawn": stake * multiplier,
+                }
+                for combo, stake, tickets in combos
+            ],
+        })
 
 
 # =======================================
@@ -316,23 +439,151 @@ class CurrentRoundStatusView(APIView):
 
 
 
-class TicketDetailView(APIView):
+TICKET_DETAIL_FIELDS = ("ticket_code", "round_id", "numbers", "amount", "created_at", "winning", "win_amount")
+
+
+def ticket_detail_data(row):
+    """TicketSerializer's output, built from a values() row of TICKET_DETAIL_FIELDS."""
+    return {
+        "ticket_code": row["ticket_code"],
+        "round": row["round_id"],
+        "numbers": row["numbers"],
+        "amount": str(row["amount"]),
+        "created_at": row["created_at"],
+        "winning": row["winning"],
+        "win_amount": str(row["win_amount"]),
+    }
+
+
+class TicketDetailView(ConditionalGetMixin, APIView):
     """
     Retrieve a single ticket by its ticket_code.
     Users search using the short, user-friendly ticket_code.
+    Tickets of finished rounds are final and served from settled_tickets.
+    An open round's ticket cannot change before accept_until, so clients may
+    keep it until then; a settled one for FINAL_MAX_AGE.
     """
 
     def get(self, request, ticket_code):
+        data = settled_tickets.get(ticket_code)
+        settled, fresh_for = True, FINAL_MAX_AGE
+
+        if data is None:
+            fields = (*TICKET_DETAIL_FIELDS, "round__is_finished", "round__accept_until")
+            ticket = Ticket.objects.filter(ticket_code=ticket_code).values(*fields).first()
+            if ticket is None:
+                # Tickets of long-settled rounds, see api/archive.py
+                ticket = ArchivedTicket.objects.filter(ticket_code=ticket_code).values(*fields).first()
+            if ticket is None:
+                return Response(
+                    {"detail": "Ticket not found"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            data = ticket_detail_data(ticket)
+            settled = ticket["round__is_finished"]
+            if settled:
+                settled_tickets.put(ticket_code, data)
+            elif ticket["round__accept_until"]:
+                fresh_for = (ticket["round__accept_until"] - timezone.now()).total_seconds()
+            else:
+                fresh_for = 0
+
+        version = (ticket_code, settled, data["winning"], data["win_amount"])
+        return self.not_modified(request, version, fresh_for, private=True) or Response(data)
+
+
+class TicketCacheStatsView(APIView):
+    """This worker's settled-ticket cache counters (operators)."""
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(settled_tickets.stats())
+
+
+# =======================================
+# TICKET HISTORY VIEW
+# =======================================
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def encode_history_cursor(row):
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_history_cursor(cursor):
+    """(created_at, id) of the last ticket of the previous page. Raises ValueError."""
+    try:
+        created_at, ticket_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        created_at = datetime.fromisoformat(created_at)
+    except (UnicodeError, ValueError, TypeError) as exc:
+        raise ValueError(cursor) from exc
+    if timezone.is_naive(created_at):
+        raise ValueError(cursor)
+    return created_at, int(ticket_id)
+
+
+class TicketHistoryView(APIView):
+    """
+    The player's tickets, newest first, a page at a time.
+    Pages are keyed on (created_at, id) instead of an offset, so every page
+    is one range read on ticket_user_history_idx however deep it is.
+    Pass `next_cursor` back as `cursor` for the following page.
+    Optional filters: `round` (id) and `winning` (true/false).
+    Archived tickets all predate the live ones, so once the live table
+    runs out the page continues into ArchivedTicket with the same keys.
+    """
+
+    def get(self, request):
+        params = request.query_params
         try:
-            ticket = Ticket.objects.get(ticket_code=ticket_code)
-        except Ticket.DoesNotExist:
-            return Response(
-                {"detail": "Ticket not found"},
-                status=status.HTTP_404_NOT_FOUND
+            limit = int(params.get("limit", HISTORY_PAGE_SIZE))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"detail": "Invalid limit"}, status=400)
+        limit = min(limit, HISTORY_MAX_PAGE_SIZE)
+
+        conditions = Q(user=request.user)
+
+        if "round" in params:
+            try:
+                conditions &= Q(round_id=int(params["round"]))
+            except ValueError:
+                return Response({"detail": "Invalid round"}, status=400)
+
+        if "winning" in params:
+            winning = params["winning"].lower()
+            if winning not in ("true", "false"):
+                return Response({"detail": "winning must be true or false"}, status=400)
+            conditions &= Q(winning=winning == "true")
+
+        if params.get("cursor"):
+            try:
+                created_at, ticket_id = decode_history_cursor(params["cursor"])
+            except ValueError:
+                return Response({"detail": "Invalid cursor"}, status=400)
+            # (created_at, id) < cursor, written so created_at stays a plain range on the index
+            conditions &= Q(created_at__lte=created_at) & ~Q(created_at=created_at, id__gte=ticket_id)
+
+        rows = []
+        for model in (Ticket, ArchivedTicket):
+            rows += (
+                model.objects.filter(conditions)
+                .order_by("-created_at", "-id")
+                .values("id", *TICKET_DETAIL_FIELDS)[:limit + 1 - len(rows)]
             )
+            if len(rows) > limit:
+                break
+        next_cursor = encode_history_cursor(rows[limit - 1]) if len(rows) > limit else None
 
-        serializer = TicketSerializer(ticket)
-        return Response(serializer.data)
+        return Response({
+            "results": [ticket_detail_data(row) for row in rows[:limit]],
+            "next_cursor": next_cursor,
+        })
 
 
 
@@ -371,16 +622,12 @@ class RequestWithdrawalView(APIView):
         if not profile.can_withdraw():
             return Response({"error": "Withdrawal info not approved or 48h not passed"}, status=400)
 
-        # Check user balance
-        if profile.balance < amount:
-            return Response({"error": "Insufficient balance"}, status=400)
-
         reference = str(uuid.uuid4())
 
         # Deduct balance and create withdrawal atomically
         with transaction.atomic():
-            profile.balance -= amount
-            profile.save()
+            if not profile.debit(amount):
+                return Response({"error": "Insufficient balance"}, status=400)
 
             withdrawal = BankWithdrawal.objects.create(
                 user=user,
@@ -433,12 +680,12 @@ class AdminRejectWithdrawalView(APIView):
             return Response({"error": "Withdrawal not found or already processed"}, status=404)
 
         with transaction.atomic():
-            # Refund user
-            profile = withdrawal.user.profile
-            profile.balance += withdrawal.amount
-            profile.save()
+            # Only the request that moves it out of PENDING refunds it
+            rejected = BankWithdrawal.objects.filter(pk=withdrawal.pk, status="PENDING").update(status="REJECTED")
+            if not rejected:
+                return Response({"error": "Withdrawal not found or already processed"}, status=404)
 
-            withdrawal.status = "REJECTED"
-            withdrawal.save(update_fields=["status"])
+            # Refund user
+            withdrawal.user.profile.add_funds(withdrawal.amount)
 
         return Response({"message": "Withdrawal rejected and refunded"})
@@ -14,8 +14,7 @@ def credit_user_wallet(user, amount, reference=None, source=None):
     with transaction.atomic():
         # update profile balance
         profile, _ = Profile.objects.get_or_create(user=user)
-        profile.balance += amount
-        profile.save()
+        profile.add_funds(amount)
 
         # mark the transaction completed if reference exists
         if reference:
@@ -189,3 +189,53 @@ DEFAULT_FROM_EMAIL = 'Shiparamax Logistics <eguloyas3@gmail.com>'
 
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Celery
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)  # chords need a result backend
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER") == "1"
+
+# Settle big rounds across Celery workers instead of inside manage_rounds
+SETTLEMENT_FANOUT = os.getenv("SETTLEMENT_FANOUT") == "1"
+SETTLEMENT_FANOUT_MIN_TICKETS = 50000   # smaller rounds are settled inline
+SETTLEMENT_CHUNK_TICKETS = 20000        # ticket-id range per worker task
+SETTLEMENT_STALL_SECONDS = 600          # re-dispatch a settlement not finished after this long
+
+# Losing-round draw selection once every number has been played, see api/draw_optimizer.py
+DRAW_OPTIMIZER_POLICY = "min_payout"      # or "random_below_cap"
+DRAW_OPTIMIZER_CANDIDATES = 100_000       # most candidate draws scored per round
+DRAW_OPTIMIZER_BATCH = 2048               # candidates scored per NumPy step
+DRAW_OPTIMIZER_TIME_BUDGET_MS = 250       # stop scoring after this long
+DRAW_OPTIMIZER_MAX_PAYOUT_RATIO = 0.5     # random_below_cap: payout cap as a share of total stake
+
+# Shared cache: Redis when available, so LotterySettings edits reach every process
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+LOTTERY_SETTINGS_TTL = 30   # seconds a settings snapshot is trusted without a version change
+
+# Keys the ticket code permutation (api/ticket_codes.py). A dedicated secret: whoever
+# holds it can list every ticket code in order. Never change it once codes have been
+# issued, or new codes may repeat old ones.
+# Required to sell tickets: allocating a code without it raises ImproperlyConfigured.
+TICKET_CODE_KEY = os.getenv("TICKET_CODE_KEY", "")
+
+# Test runs get a throwaway TICKET_CODE_KEY
+TEST_RUNNER = "backend.test_runner.TestRunner"
+
+# Plays this many seconds or less before accept_until go through the write-behind
+# buffer in TICKET_STAGING_PATH (api/ticket_staging.py); 0 disables it.
+# Single host only: the web workers and manage_rounds must share that file,
+# or plays staged on other hosts are never flushed before the draw.
+TICKET_STAGING_SECONDS = int(os.getenv("TICKET_STAGING_SECONDS", "0"))
+TICKET_STAGING_PATH = os.getenv("TICKET_STAGING_PATH", str(BASE_DIR / "ticket_staging.sqlite3"))
+
+# Settled tickets served by TicketDetailView from a per-process LRU of this many
+# entries, backed by the shared cache for TICKET_CACHE_SHARED_TIMEOUT seconds
+# (0 keeps them per-process only; LocMem is per-process anyway)
+TICKET_CACHE_SIZE = int(os.getenv("TICKET_CACHE_SIZE", "10000"))
+TICKET_CACHE_SHARED_TIMEOUT = int(os.getenv("TICKET_CACHE_SHARED_TIMEOUT", "86400" if REDIS_URL else "0"))
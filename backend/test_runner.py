@@ -0,0 +1,19 @@
+# backend/test_runner.py
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_TICKET_CODE_KEY = "test-only-ticket-code-key"
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner that gives test runs a throwaway TICKET_CODE_KEY."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.ticket_code_key = override_settings(TICKET_CODE_KEY=TEST_TICKET_CODE_KEY)
+        self.ticket_code_key.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.ticket_code_key.disable()
+        super().teardown_test_environment(**kwargs)
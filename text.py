@@ -1,6 +1,5 @@
-import time
 import os
 
-while True:
-    os.system("python manage.py manage_rounds")
-    time.sleep(5)   # check every 5 seconds
+# The scheduler stays running and wakes at each round deadline by itself,
+# so there is no need to re-launch manage_rounds every few seconds.
+os.system("python manage.py run_rounds")